@@ -7,7 +7,7 @@ source.include_exts = py,png,jpg,kv,atlas,json,txt
 version = 2.0
 
 # Requirements including opencv for inpainting
-requirements = python3,kivy==2.3.0,kivymd==1.2.0,pillow,requests,certifi,urllib3,openai,pyjnius,android,cryptography,numpy
+requirements = python3,kivy==2.3.0,kivymd==1.2.0,pillow,requests,requests-toolbelt,certifi,urllib3,openai,pyjnius,android,cryptography,numpy
 
 # Resources
 presplash.filename = %(source.dir)s/assets/presplash.png
@@ -22,6 +22,9 @@ from kivy.config import Config
 if not ANDROID:
     Config.set('graphics', 'width', '400')
     Config.set('graphics', 'height', '800')
+# Shorter double-tap window (default 250 ms) for snappier viewer zoom reset
+Config.set('postproc', 'double_tap_time', '200')
+Config.set('postproc', 'double_tap_distance', '20')
 
 # Main imports
 from kivymd.app import MDApp
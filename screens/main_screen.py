@@ -359,8 +359,10 @@ class MainScreen(Screen):
             padding=5
         )
         
-        # Create image widget
-        texture = self.image_processor.create_texture_from_data(image_data)
+        # Create image widget (preview-sized texture for the small card)
+        texture = self.image_processor.create_texture_from_data(
+            image_data, target_size=(300, 300)
+        )
         if texture:
             img = Image(
                 texture=texture,
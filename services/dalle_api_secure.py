@@ -31,13 +31,14 @@ class RateLimiter:
     def __init__(self, requests_per_minute=5):
         self.requests_per_minute = requests_per_minute
         self.min_interval = 60.0 / requests_per_minute
-        self.last_request_time = 0
+        # Monotonic clock: NTP/wall-clock adjustments can't skew the interval
+        self.last_request_time = time.monotonic() - self.min_interval
         self.lock = Lock()
     
     def wait_if_needed(self):
         """Wait if necessary to respect rate limit"""
         with self.lock:
-            current_time = time.time()
+            current_time = time.monotonic()
             time_since_last = current_time - self.last_request_time
             
             if time_since_last < self.min_interval:
@@ -45,7 +46,7 @@ class RateLimiter:
                 Logger.info(f"RateLimiter: Sleeping for {sleep_time:.2f}s")
                 time.sleep(sleep_time)
             
-            self.last_request_time = time.time()
+            self.last_request_time = time.monotonic()
 
 class SecureHTTPAdapter:
     """HTTP adapter with certificate pinning and enhanced security"""
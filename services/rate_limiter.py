@@ -17,15 +17,15 @@ class TokenBucket:
         self.capacity = capacity
         self.tokens = capacity
         self.refill_rate = refill_rate
-        self.last_refill = time.time()
+        self.last_refill = time.monotonic()
         self.lock = threading.Lock()
     
     def consume(self, tokens=1):
         """Try to consume tokens"""
         with self.lock:
             # Refill tokens
-            now = time.time()
-            elapsed = now - self.last_refill
+            now = time.monotonic()
+            elapsed = max(0.0, now - self.last_refill)
             self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
             self.last_refill = now
             
@@ -60,7 +60,7 @@ class CircuitBreaker:
             if self.state == 'open':
                 # Check if we should try half-open
                 if self.last_failure_time and \
-                   time.time() - self.last_failure_time > self.recovery_timeout:
+                   time.monotonic() - self.last_failure_time > self.recovery_timeout:
                     self.state = 'half_open'
                     Logger.info("CircuitBreaker: Attempting recovery (half-open)")
                 else:
@@ -81,7 +81,7 @@ class CircuitBreaker:
         except self.expected_exception as e:
             with self.lock:
                 self.failure_count += 1
-                self.last_failure_time = time.time()
+                self.last_failure_time = time.monotonic()
                 
                 if self.failure_count >= self.failure_threshold:
                     self.state = 'open'
@@ -52,6 +52,16 @@ class TestInputValidation(unittest.TestCase):
         prompt, issues = InputValidator.sanitize_prompt("<script>alert('xss')</script>")
         self.assertIn("Removed potential XSS attempt", issues)
         
+        # XSS split by SQL comment markers must not be rejoined
+        for split, expected in [
+            ("java--script:alert(1)", "alert(1)"),
+            ("<a oner--ror=alert(1)>", "&lt;a alert(1)&gt;"),
+            ("on--click=x", "x"),
+        ]:
+            prompt, issues = InputValidator.sanitize_prompt(split)
+            self.assertEqual(prompt, expected)
+            self.assertIn("Removed potential XSS attempt", issues)
+        
         # Too long prompt
         long_prompt = "a" * 2000
         prompt, issues = InputValidator.sanitize_prompt(long_prompt)
@@ -117,6 +127,12 @@ class TestSecureLogging(unittest.TestCase):
         message = logger._redact_sensitive_data("User email: user@example.com")
         self.assertIn("***@***.***", message)
         self.assertNotIn("user@example.com", message)
+        
+        # Digits glued to an API key are redacted once the key is replaced
+        message = logger._redact_sensitive_data("key sk-" + "a" * 48 + "123-45-6789")
+        self.assertEqual(message, "key sk-***REDACTED******-**-****")
+        message = logger._redact_sensitive_data("key sk-" + "a" * 48 + "1234567890123456")
+        self.assertNotIn("1234567890123456", message)
 
 class TestContentFilter(unittest.TestCase):
     """Test content filtering"""
@@ -0,0 +1,43 @@
+"""
+JSON and file-read helpers shared by the storage modules
+"""
+
+import os
+import json
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def dumps(obj) -> bytes:
+    """Serialize obj to compact UTF-8 JSON (orjson when available)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def loads(data: bytes):
+    """Parse UTF-8 JSON bytes (orjson when available)"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def read_bytes(path) -> bytes:
+    """Read a whole file with unbuffered reads sized from fstat"""
+    fd = os.open(path, os.O_RDONLY)  # Non-inheritable (O_CLOEXEC) by default
+    try:
+        size = os.fstat(fd).st_size
+        data = os.read(fd, size)
+        # os.read may return short on large files; finish what fstat reported
+        while len(data) < size:
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+    finally:
+        os.close(fd)
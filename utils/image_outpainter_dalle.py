@@ -29,7 +29,8 @@ class OutpaintCanvas(Widget):
     def __init__(self, image_path, **kwargs):
         super().__init__(**kwargs)
         self.image_path = image_path
-        self.pil_image = PILImage.open(image_path)
+        # Restrict format sniffing; pixel data is only loaded on first use
+        self.pil_image = PILImage.open(image_path, formats=('PNG', 'JPEG', 'WEBP'))
         self.original_width, self.original_height = self.pil_image.size
         
         # Extension settings
@@ -136,9 +137,16 @@ class OutpaintCanvas(Widget):
         if self.extensions['bottom']:
             new_height += self.extension_size
         
-        # Create extended image (transparent background)
-        extended_image = PILImage.new('RGBA', (new_width, new_height), (0, 0, 0, 0))
-        extended_image.paste(self.pil_image.convert('RGBA'), (offset_x, offset_y))
+        # Create extended image (transparent background). The RGBA buffer is
+        # filled in numpy and wrapped by PIL without a further copy (the
+        # image holds its own reference to the array).
+        out = np.zeros((new_height, new_width, 4), dtype=np.uint8)
+        out[offset_y:offset_y + self.original_height,
+            offset_x:offset_x + self.original_width] = np.asarray(
+                self.pil_image.convert('RGBA'))
+        extended_image = PILImage.frombuffer(
+            'RGBA', (new_width, new_height), out, 'raw', 'RGBA', 0, 1
+        )
         
         # Create mask (white = generate, black = keep)
         mask = PILImage.new('L', (new_width, new_height), 0)  # Start all black
@@ -481,8 +489,18 @@ class ImageOutpainterDALLE(MDDialog):
                     save_path = Path(app.user_data_dir) / 'gallery' / filename
                     save_path.parent.mkdir(exist_ok=True)
                     
-                    with open(save_path, 'wb') as f:
-                        f.write(response.content)
+                    # Write unbuffered and drop the pages from the cache;
+                    # the gallery reloads the file later on its own
+                    fd = os.open(str(save_path),
+                                 os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                    try:
+                        data = memoryview(response.content)
+                        while data:
+                            data = data[os.write(fd, data):]
+                        if hasattr(os, 'posix_fadvise'):
+                            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                    finally:
+                        os.close(fd)
                     
                     Snackbar(text=f"Extension saved as {filename}").open()
                     
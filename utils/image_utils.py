@@ -108,12 +108,28 @@ class ImageProcessor:
             print(f"Error downloading image: {e}")
             return None
     
-    def create_texture_from_data(self, image_data: bytes) -> Optional[Texture]:
-        """Create Kivy texture from image data"""
+    def create_texture_from_data(self, image_data: bytes,
+                                 target_size: Optional[Tuple[int, int]] = None
+                                 ) -> Optional[Texture]:
+        """
+        Create Kivy texture from image data
+        
+        Args:
+            image_data: Image bytes data
+            target_size: Optional (width, height) of the preview; when given,
+                large images are decoded/downscaled close to this size
+        """
         try:
             # Convert bytes to PIL Image
             image = PILImage.open(io.BytesIO(image_data))
             
+            if target_size:
+                # JPEG can decode directly at a reduced scale
+                if image.format == 'JPEG':
+                    image.draft('RGB', target_size)
+                if image.size[0] > 2 * target_size[0]:
+                    image.thumbnail(target_size, PILImage.Resampling.BILINEAR)
+            
             # Convert to RGBA
             if image.mode != 'RGBA':
                 image = image.convert('RGBA')
@@ -0,0 +1,292 @@
+"""
+Shared base for the full screen image viewers (zoom, pan, share, delete)
+"""
+
+from kivymd.uix.dialog import MDDialog
+from kivy.graphics.texture import Texture
+from kivy.cache import Cache
+import kivy.core.image  # noqa: F401 (registers the kv.texture/kv.image caches)
+from kivy.lang import Builder
+from kivy.factory import Factory
+from kivy.core.window import Window
+from kivymd.uix.snackbar import Snackbar
+from kivy.clock import Clock
+from kivy.logger import Logger
+import os
+import threading
+
+from utils.android_utils import share_image
+from utils.dialogs import ConfirmDialog
+
+# Bound the texture/image caches so stacked viewers cannot exhaust GPU memory.
+# Only the limit changes: re-registering would drop Kivy's timeout and entries.
+for _category in ('kv.texture', 'kv.image'):
+    if _category in Cache._categories:
+        Cache._categories[_category]['limit'] = 32
+    else:
+        Cache.register(_category, limit=32)
+
+# Shared viewer layout (toolbar, zoomable image, instructions), compiled once
+KV = '''
+<_ImageViewerContent@MDBoxLayout>:
+    orientation: 'vertical'
+    spacing: dp(10)
+    padding: dp(10)
+    
+    MDBoxLayout:
+        id: toolbar
+        orientation: 'horizontal'
+        size_hint_y: None
+        height: dp(56)
+        spacing: dp(10)
+        
+        MDLabel:
+            id: title
+            theme_text_color: "Primary"
+            font_style: "H6"
+        
+        MDIconButton:
+            id: share_btn
+            icon: "share-variant"
+            theme_text_color: "Custom"
+            text_color: 0, 0.7, 1, 1
+        
+        MDIconButton:
+            id: delete_btn
+            icon: "delete"
+            theme_text_color: "Custom"
+            text_color: 1, 0, 0, 1
+        
+        MDIconButton:
+            id: close_btn
+            icon: "close"
+    
+    # Image container with scatter for zoom/pan
+    Scatter:
+        id: scatter
+        do_rotation: False
+        do_translation: True
+        scale_min: 0.5
+        scale_max: 4.0
+        
+        Image:
+            id: image
+            allow_stretch: True
+            keep_ratio: True
+    
+    MDLabel:
+        id: instructions
+        theme_text_color: "Secondary"
+        font_style: "Caption"
+        halign: "center"
+        size_hint_y: None
+        height: dp(30)
+'''
+
+Builder.load_string(KV)
+
+
+def _bulk_unlink(paths):
+    """
+    Remove files in one pass, ignoring ones that are already gone
+    Returns True if none of them failed
+    """
+    ok = True
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            Logger.error(f"ImageViewer: Error deleting {path}: {e}")
+            ok = False
+    return ok
+
+
+class _BaseImageViewer(MDDialog):
+    """Common viewer dialog behaviour shared by ImageViewer and ImageViewerDALLE"""
+    
+    # Layout/text settings overridden by subclasses
+    title_size_hint_x = 0.7
+    instructions_text = "Pinch to zoom • Double tap to reset • Swipe to pan"
+    share_text = "Check out this image!"
+    
+    # Open viewers (most recent last) share a single Window keyboard binding
+    _viewer_stack = []
+    _kb_bound = False
+    
+    def __init__(self, image_path, on_delete_callback=None,
+                 size_hint=(0.95, 0.9), **kwargs):
+        self.image_path_str = str(image_path)
+        self.image_name = os.path.basename(self.image_path_str)
+        self.on_delete_callback = on_delete_callback
+        self._confirm_dlg = None
+        self._prewarm_gen = 0
+        
+        # Decode the image in parallel with building the widgets
+        self._start_prewarm()
+        
+        # Create content
+        content = self._create_content()
+        
+        # Initialize dialog
+        super().__init__(
+            type="custom",
+            content_cls=content,
+            size_hint=size_hint,
+            **kwargs
+        )
+        
+        # Bind keyboard
+        _BaseImageViewer._viewer_stack.append(self)
+        if not _BaseImageViewer._kb_bound:
+            Window.bind(on_keyboard=_BaseImageViewer._cls_on_keyboard)
+            _BaseImageViewer._kb_bound = True
+    
+    def _create_content(self, extra_buttons=()):
+        """Create the viewer content from the shared KV layout"""
+        layout = Factory._ImageViewerContent()
+        ids = layout.ids
+        
+        self._build_toolbar(ids, extra_buttons)
+        ids.instructions.text = self.instructions_text
+        
+        # Bind double tap to reset zoom
+        ids.image.bind(on_touch_down=self._on_image_touch)
+        
+        # Store references
+        self.scatter = ids.scatter
+        self.image = ids.image
+        return layout
+    
+    def _build_toolbar(self, ids, extra_buttons=()):
+        """Fill in the title, wire the action buttons and add any extras"""
+        ids.title.text = self.image_name
+        ids.title.size_hint_x = self.title_size_hint_x
+        self.title_label = ids.title
+        
+        # Extra buttons go right after the title, in the given order
+        toolbar = ids.toolbar
+        for btn in reversed(extra_buttons):
+            toolbar.add_widget(btn, index=len(toolbar.children) - 1)
+        
+        ids.share_btn.bind(on_release=lambda x: self._share_image())
+        ids.delete_btn.bind(on_release=lambda x: self._delete_image())
+        ids.close_btn.bind(on_release=lambda x: self.dismiss())
+    
+    def _start_prewarm(self):
+        """Decode the current image in the background, superseding earlier decodes"""
+        self._prewarm_gen += 1
+        threading.Thread(
+            target=self._prewarm, args=(self.image_path_str, self._prewarm_gen),
+            daemon=True
+        ).start()
+    
+    def _prewarm(self, path, gen):
+        """Decode path on a background thread"""
+        try:
+            from PIL import Image as PILImage
+            with PILImage.open(path) as im:
+                im = im.convert('RGBA')
+                size, pixels = im.size, im.tobytes()
+        except Exception:
+            size = pixels = None
+        Clock.schedule_once(lambda dt: self._apply_prewarmed(path, gen, size, pixels), 0)
+    
+    def _apply_prewarmed(self, path, gen, size, pixels):
+        """Upload the decoded pixels (UI thread); fall back to loading by source"""
+        if gen != self._prewarm_gen or path != self.image_path_str:
+            # Another image was opened, or the viewer dismissed, meanwhile
+            return
+        if pixels is None:
+            self.image.source = path
+            return
+        texture = Texture.create(size=size, colorfmt='rgba')
+        texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+        texture.flip_vertical()
+        self.image.texture = texture
+    
+    def _on_image_touch(self, widget, touch):
+        """Handle double tap to reset zoom"""
+        if widget.collide_point(*touch.pos) and touch.is_double_tap:
+            # Reset zoom and position
+            self.scatter.scale = 1
+            self.scatter.pos = (0, 0)
+    
+    def _share_image(self):
+        """Share the current image"""
+        def worker():
+            # The share intent is a blocking binder call on Android
+            try:
+                success = share_image(self.image_path_str, self.share_text)
+                text = "Opening share dialog..." if success else "Failed to share image"
+            except Exception as e:
+                text = f"Share error: {str(e)}"
+            Clock.schedule_once(lambda dt: Snackbar(text=text).open(), 0)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def _delete_image(self):
+        """Delete the image with confirmation"""
+        text = f"Are you sure you want to delete {self.image_name}?"
+        if self._confirm_dlg is None:
+            self._confirm_dlg = ConfirmDialog(
+                title="Delete Image?",
+                text=text,
+                on_confirm=self._confirm_delete
+            )
+        else:
+            self._confirm_dlg.text = text
+        self._confirm_dlg.open()
+    
+    def _paths_to_delete(self):
+        """Files removed together when the image is deleted"""
+        return [self.image_path_str]
+    
+    def _confirm_delete(self):
+        """Actually delete the image (on a background thread)"""
+        paths = self._paths_to_delete()
+        on_delete_callback = self.on_delete_callback
+        
+        def worker():
+            deleted = _bulk_unlink(paths)
+            Clock.schedule_once(lambda dt: on_deleted(deleted), 0)
+        
+        def on_deleted(deleted):
+            Snackbar(text="Image deleted" if deleted else "Delete failed").open()
+            # Call callback if provided, once the files are gone
+            if on_delete_callback:
+                on_delete_callback()
+        
+        threading.Thread(target=worker, daemon=True).start()
+        
+        self.dismiss()
+    
+    @classmethod
+    def _cls_on_keyboard(cls, window, key, scancode, codepoint, modifier):
+        """Route keyboard events to the top-most open viewer"""
+        if cls._viewer_stack:
+            return cls._viewer_stack[-1]._on_keyboard(
+                window, key, scancode, codepoint, modifier
+            )
+        return False
+    
+    def _on_keyboard(self, window, key, scancode, codepoint, modifier):
+        """Handle keyboard events"""
+        if key == 27:  # ESC or Back button
+            self.dismiss()
+            return True
+        return False
+    
+    def on_dismiss(self):
+        """Clean up when dialog is dismissed"""
+        # Release the GL texture now rather than when the widget is collected;
+        # a decode still running must not set a new one
+        self._prewarm_gen += 1
+        self.image.source = ''
+        self.image.texture = None
+        if self in _BaseImageViewer._viewer_stack:
+            _BaseImageViewer._viewer_stack.remove(self)
+        if not _BaseImageViewer._viewer_stack and _BaseImageViewer._kb_bound:
+            Window.unbind(on_keyboard=_BaseImageViewer._cls_on_keyboard)
+            _BaseImageViewer._kb_bound = False
@@ -3,164 +3,111 @@ DALL-E enhanced image viewer with AI features
 Supports image variations and future inpainting/outpainting
 """
 
-from kivymd.uix.dialog import MDDialog
 from kivymd.uix.button import MDFlatButton, MDIconButton, MDRaisedButton
 from kivymd.uix.boxlayout import MDBoxLayout
 from kivymd.uix.label import MDLabel
 from kivymd.uix.card import MDCard
-from kivymd.uix.textfield import MDTextField
-from kivymd.uix.selectioncontrol import MDCheckbox
-from kivy.uix.scatter import Scatter
-from kivy.uix.image import Image
+from kivy.uix.image import AsyncImage
+from kivy.uix.behaviors import ButtonBehavior
+from kivy.loader import Loader
 from kivy.metrics import dp
-from kivy.core.window import Window
 from kivymd.uix.snackbar import Snackbar
 from kivymd.uix.progressindicator import MDCircularProgressIndicator
 from kivymd.uix.gridlayout import MDGridLayout
 from pathlib import Path
+import hashlib
 import os
-from typing import Optional, Callable, List
+import threading
+from typing import List
 from kivy.clock import Clock
 
-from utils.android_utils import share_image
+from utils.image_viewer_base import _BaseImageViewer
+from utils.storage import get_storage_path
 
+# Decode variation previews on Kivy's loader threads instead of the UI thread
+Loader.num_workers = 2
 
-class ImageViewerDALLE(MDDialog):
+# Metric conversions used by the viewer layout, computed once at import
+(_DP5, _DP10, _DP15, _DP20, _DP25, _DP30,
+ _DP40, _DP48, _DP50, _DP100, _DP320) = map(
+    dp, (5, 10, 15, 20, 25, 30, 40, 48, 50, 100, 320))
+
+THUMB_SIZE = (96, 96)  # 2x the 48dp preview button
+
+
+def _make_thumb(path):
+    """Create (or reuse) a cached preview thumbnail for an image file"""
+    # App-private storage: the home directory isn't writable on Android
+    thumb_dir = Path(get_storage_path()) / 'thumbs'
+    thumb_dir.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha1(str(path).encode('utf-8')).hexdigest()
+    thumb_path = thumb_dir / f"{digest}.jpg"
+    
+    # Reuse the thumbnail unless the source changed since it was made
+    try:
+        if thumb_path.stat().st_mtime >= os.stat(path).st_mtime:
+            return thumb_path
+    except FileNotFoundError:
+        pass
+    
+    from PIL import Image as PILImage
+    with PILImage.open(path) as im:
+        im.thumbnail(THUMB_SIZE, PILImage.LANCZOS)
+        im.convert('RGB').save(thumb_path, 'JPEG', quality=80)
+    return thumb_path
+
+
+class _PreviewBtn(ButtonBehavior, AsyncImage):
+    """Clickable variation thumbnail"""
+
+
+class ImageViewerDALLE(_BaseImageViewer):
     """DALL-E enhanced image viewer with AI features"""
     
+    title_size_hint_x = 0.6
+    instructions_text = "Pinch to zoom • Double tap to reset • Tap AI icon for DALL-E features"
+    share_text = "Check out this DALL-E image!"
+    
+    _SELECTED_BG = (0.5, 0.5, 1, 0.3)
+    _UNSELECTED_BG = (0, 0, 0, 0)
+    _PANEL_PAD = (_DP10, 0, 0, 0)
+    
     def __init__(self, image_path, on_delete_callback=None, **kwargs):
-        self.image_path = Path(image_path)
-        self.on_delete_callback = on_delete_callback
-        self.processing = False
-        self.variation_paths: List[Path] = []
+        # Held from dispatch until the result reaches the UI thread
+        self._variations_lock = threading.Lock()
+        self.variation_paths: List[str] = []
         
-        # Create content
-        content = self._create_content()
-        
-        # Initialize dialog
         super().__init__(
-            type="custom",
-            content_cls=content,
+            image_path,
+            on_delete_callback=on_delete_callback,
             size_hint=(0.95, 0.95),
             **kwargs
         )
-        
-        # Bind keyboard
-        Window.bind(on_keyboard=self._on_keyboard)
     
     def _create_content(self):
         """Create the viewer content with DALL-E features"""
-        # Main container
-        layout = MDBoxLayout(
-            orientation='vertical',
-            spacing=dp(10),
-            padding=dp(10)
-        )
-        
-        # Top toolbar
-        toolbar = MDBoxLayout(
-            orientation='horizontal',
-            size_hint_y=None,
-            height=dp(56),
-            spacing=dp(10)
-        )
-        
-        # Title
-        title = MDLabel(
-            text=self.image_path.name,
-            theme_text_color="Primary",
-            font_style="H6",
-            size_hint_x=0.6
-        )
-        toolbar.add_widget(title)
-        
-        # Action buttons
         ai_btn = MDIconButton(
             icon="creation",
             theme_text_color="Custom",
             text_color=(0.5, 0.5, 1, 1),
             on_release=lambda x: self._toggle_ai_panel()
         )
-        toolbar.add_widget(ai_btn)
-        
-        share_btn = MDIconButton(
-            icon="share-variant",
-            theme_text_color="Custom",
-            text_color=(0, 0.7, 1, 1),
-            on_release=lambda x: self._share_image()
-        )
-        toolbar.add_widget(share_btn)
-        
-        delete_btn = MDIconButton(
-            icon="delete",
-            theme_text_color="Custom",
-            text_color=(1, 0, 0, 1),
-            on_release=lambda x: self._delete_image()
-        )
-        toolbar.add_widget(delete_btn)
-        
-        close_btn = MDIconButton(
-            icon="close",
-            on_release=lambda x: self.dismiss()
-        )
-        toolbar.add_widget(close_btn)
-        
-        layout.add_widget(toolbar)
-        
-        # Image container with scatter for zoom/pan
-        scatter = Scatter(
-            do_rotation=False,
-            do_translation=True,
-            scale_min=0.5,
-            scale_max=4.0,
-            size_hint=(1, 1)
-        )
-        
-        # Image
-        image = Image(
-            source=str(self.image_path),
-            allow_stretch=True,
-            keep_ratio=True
-        )
-        
-        # Bind double tap to reset zoom
-        image.bind(on_touch_down=self._on_image_touch)
-        self.last_touch_time = 0
+        layout = super()._create_content(extra_buttons=(ai_btn,))
         
-        scatter.add_widget(image)
-        layout.add_widget(scatter)
+        # AI panel is built on first use (see _toggle_ai_panel)
+        self.ai_panel = None
+        self.results_preview = None
+        self._ai_panel_parent = layout
         
-        # Store references
-        self.scatter = scatter
-        self.image = image
-        
-        # AI panel (initially hidden)
-        ai_panel = self._create_ai_panel()
-        ai_panel.opacity = 0
-        ai_panel.disabled = True
-        layout.add_widget(ai_panel)
-        self.ai_panel = ai_panel
-        
-        # Progress indicator
+        # Progress indicator, above the instructions
         progress = MDCircularProgressIndicator(
             size_hint=(None, None),
-            size=(dp(48), dp(48)),
+            size=(_DP48, _DP48),
             pos_hint={'center_x': 0.5, 'center_y': 0.5}
         )
-        progress.opacity = 0
-        layout.add_widget(progress)
+        layout.add_widget(progress, index=1)
         self.progress = progress
-        
-        # Instructions
-        instructions = MDLabel(
-            text="Pinch to zoom • Double tap to reset • Tap AI icon for DALL-E features",
-            theme_text_color="Secondary",
-            font_style="Caption",
-            halign="center",
-            size_hint_y=None,
-            height=dp(30)
-        )
-        layout.add_widget(instructions)
+        self._set_progress(False)
         
         return layout
     
@@ -168,10 +115,10 @@ class ImageViewerDALLE(MDDialog):
         """Create the DALL-E AI features panel"""
         panel = MDCard(
             orientation='vertical',
-            padding=dp(15),
-            spacing=dp(10),
+            padding=_DP15,
+            spacing=_DP10,
             size_hint_y=None,
-            height=dp(320),
+            height=_DP320,
             elevation=5
         )
         
@@ -181,7 +128,7 @@ class ImageViewerDALLE(MDDialog):
             theme_text_color="Primary",
             font_style="H6",
             size_hint_y=None,
-            height=dp(30)
+            height=_DP30
         ))
         
         # Variations section
@@ -190,7 +137,7 @@ class ImageViewerDALLE(MDDialog):
             theme_text_color="Primary",
             font_style="Subtitle2",
             size_hint_y=None,
-            height=dp(25)
+            height=_DP25
         )
         panel.add_widget(variations_label)
         
@@ -199,7 +146,7 @@ class ImageViewerDALLE(MDDialog):
             theme_text_color="Secondary",
             font_style="Caption",
             size_hint_y=None,
-            height=dp(20)
+            height=_DP20
         )
         panel.add_widget(variations_desc)
         
@@ -207,33 +154,32 @@ class ImageViewerDALLE(MDDialog):
         var_options = MDBoxLayout(
             orientation='horizontal',
             size_hint_y=None,
-            height=dp(40),
-            spacing=dp(10)
+            height=_DP40,
+            spacing=_DP10
         )
         
         var_count_label = MDLabel(
             text="Count:",
             size_hint_x=None,
-            width=dp(50)
+            width=_DP50
         )
         var_options.add_widget(var_count_label)
         
         # Count selector (1-4 variations)
         count_box = MDBoxLayout(
             orientation='horizontal',
-            spacing=dp(5)
+            spacing=_DP5
         )
         
-        self.variation_count_btns = []
+        self._count_btns = {}
         for i in range(1, 5):
-            btn = MDFlatButton(
-                text=str(i),
-                on_release=lambda x, count=i: self._set_variation_count(count)
-            )
+            btn = MDFlatButton(text=str(i))
+            btn.count = i
+            btn.bind(on_release=self._on_count_btn)
             if i == 2:  # Default to 2 variations
-                btn.md_bg_color = (0.5, 0.5, 1, 0.3)
+                btn.md_bg_color = self._SELECTED_BG
             count_box.add_widget(btn)
-            self.variation_count_btns.append(btn)
+            self._count_btns[i] = btn
         
         var_options.add_widget(count_box)
         panel.add_widget(var_options)
@@ -252,7 +198,7 @@ class ImageViewerDALLE(MDDialog):
         panel.add_widget(MDLabel(
             text="",
             size_hint_y=None,
-            height=dp(10)
+            height=_DP10
         ))
         
         # Inpainting section
@@ -261,7 +207,7 @@ class ImageViewerDALLE(MDDialog):
             theme_text_color="Primary",
             font_style="Subtitle2",
             size_hint_y=None,
-            height=dp(25)
+            height=_DP25
         )
         panel.add_widget(inpainting_label)
         
@@ -278,8 +224,8 @@ class ImageViewerDALLE(MDDialog):
         coming_soon_box = MDBoxLayout(
             orientation='vertical',
             size_hint_y=None,
-            height=dp(40),
-            padding=[dp(10), 0, 0, 0]
+            height=_DP40,
+            padding=self._PANEL_PAD
         )
         
         coming_soon_desc = MDLabel(
@@ -291,40 +237,45 @@ class ImageViewerDALLE(MDDialog):
         
         panel.add_widget(coming_soon_box)
         
-        # Results preview area (for variations)
+        # Results preview area is created once variations arrive
+        
+        return panel
+    
+    def _create_results_preview(self):
+        """Create the variations preview grid inside the AI panel"""
         self.results_preview = MDGridLayout(
             cols=2,
-            spacing=dp(5),
+            spacing=_DP5,
             size_hint_y=None,
-            height=dp(100),
+            height=_DP100,
             opacity=0
         )
-        panel.add_widget(self.results_preview)
-        
-        return panel
+        self.ai_panel.add_widget(self.results_preview)
     
     def _toggle_ai_panel(self):
         """Toggle the AI features panel visibility"""
-        if self.ai_panel.opacity == 0:
+        if self.ai_panel is None:
+            # Insert between the image and the progress indicator
+            self.ai_panel = self._create_ai_panel()
+            self._ai_panel_parent.add_widget(self.ai_panel, index=2)
+        elif self.ai_panel.opacity == 0:
             self.ai_panel.opacity = 1
             self.ai_panel.disabled = False
         else:
             self.ai_panel.opacity = 0
             self.ai_panel.disabled = True
     
-    def _set_variation_count(self, count):
-        """Set the number of variations to generate"""
-        self.selected_count = count
-        # Update button colors
-        for i, btn in enumerate(self.variation_count_btns):
-            if i + 1 == count:
-                btn.md_bg_color = (0.5, 0.5, 1, 0.3)
-            else:
-                btn.md_bg_color = (0, 0, 0, 0)
+    def _on_count_btn(self, btn):
+        """Select the number of variations to generate"""
+        old_btn = self._count_btns.get(self.selected_count)
+        if old_btn is not None:
+            old_btn.md_bg_color = self._UNSELECTED_BG
+        self.selected_count = btn.count
+        btn.md_bg_color = self._SELECTED_BG
     
     def _generate_variations(self):
         """Generate image variations using DALL-E API"""
-        if self.processing:
+        if not self._variations_lock.acquire(blocking=False):
             Snackbar(text="Already processing...").open()
             return
         
@@ -332,26 +283,22 @@ class ImageViewerDALLE(MDDialog):
         app = MDApp.get_running_app()
         
         if not hasattr(app, 'worker_manager'):
+            self._variations_lock.release()
             Snackbar(text="Worker system not available").open()
             return
         
-        # Show progress
-        self.processing = True
-        self.progress.opacity = 1
-        self.progress.active = True
         Snackbar(text=f"Generating {self.selected_count} variations...").open()
         
         def on_variations_complete(result):
             """Handle variations completion on main thread"""
             def update_ui(dt):
-                self.processing = False
-                self.progress.opacity = 0
-                self.progress.active = False
+                self._variations_lock.release()
+                self._set_progress(False)
                 
                 if result.get('success'):
                     variations = result.get('variations', [])
                     if variations:
-                        self.variation_paths = [Path(v) for v in variations]
+                        self.variation_paths = [str(v) for v in variations]
                         self._show_variations_preview()
                         Snackbar(text=f"Generated {len(variations)} variations!").open()
                     else:
@@ -362,48 +309,70 @@ class ImageViewerDALLE(MDDialog):
             
             Clock.schedule_once(update_ui, 0)
         
-        # Request variations through worker
+        # Show progress and request variations through worker
+        self._set_progress(True)
         app.worker_manager.generate_image_variations(
-            image_path=str(self.image_path),
+            image_path=self.image_path_str,
             count=self.selected_count,
             callback=on_variations_complete
         )
     
+    def _set_progress(self, on):
+        """Show/hide the progress indicator, stopping its animation when hidden"""
+        self.progress.opacity = 1.0 if on else 0.0
+        self.progress.active = on
+        self.progress.disabled = not on
+    
     def _show_variations_preview(self):
         """Show preview of generated variations"""
+        if self.results_preview is None:
+            self._create_results_preview()
         self.results_preview.clear_widgets()
         self.results_preview.opacity = 1
         
-        for i, var_path in enumerate(self.variation_paths[:4]):  # Show max 4 previews
-            if var_path.exists():
-                # Create clickable preview
-                preview_btn = MDIconButton(
+        for var_path in self.variation_paths[:4]:  # Show max 4 previews
+            if os.path.exists(var_path):
+                # Clickable preview, source set once the thumbnail is ready
+                preview_btn = _PreviewBtn(
                     size_hint=(None, None),
-                    size=(dp(48), dp(48))
-                )
-                
-                preview_img = Image(
-                    source=str(var_path),
+                    size=(_DP48, _DP48),
                     allow_stretch=True,
-                    keep_ratio=True
+                    keep_ratio=True,
+                    anim_delay=-1
                 )
-                preview_btn.add_widget(preview_img)
+                self._load_preview_thumb(var_path, preview_btn)
                 
-                # Open variation in new viewer on click
+                # Open variation in this viewer on click
                 preview_btn.bind(
                     on_release=lambda x, path=var_path: self._open_variation(path)
                 )
                 
                 self.results_preview.add_widget(preview_btn)
     
+    def _load_preview_thumb(self, var_path, preview_img):
+        """Build the preview thumbnail off the UI thread, then show it"""
+        def worker():
+            try:
+                thumb = str(_make_thumb(var_path))
+            except Exception:
+                thumb = var_path
+            Clock.schedule_once(lambda dt: setattr(preview_img, 'source', thumb), 0)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
     def _open_variation(self, var_path):
-        """Open a variation in a new viewer"""
-        # Create new viewer for the variation
-        viewer = ImageViewerDALLE(
-            image_path=var_path,
-            on_delete_callback=self.on_delete_callback
-        )
-        viewer.open()
+        """Show a variation in this viewer"""
+        self.image_path_str = str(var_path)
+        self.image_name = os.path.basename(self.image_path_str)
+        self.title_label.text = self.image_name
+        self._start_prewarm()
+        
+        # Reset zoom and the previous generation's results
+        self.scatter.scale = 1
+        self.scatter.pos = (0, 0)
+        self.variation_paths = []
+        self.results_preview.clear_widgets()
+        self.results_preview.opacity = 0
     
     def _open_inpainting_editor(self):
         """Open the inpainting editor for this image"""
@@ -414,7 +383,7 @@ class ImageViewerDALLE(MDDialog):
         
         # Open the editor
         editor = ImageEditorDALLE(
-            image_path=self.image_path,
+            image_path=self.image_path_str,
             on_complete_callback=self._on_edit_complete
         )
         editor.open()
@@ -425,71 +394,14 @@ class ImageViewerDALLE(MDDialog):
         if self.on_delete_callback:
             self.on_delete_callback()
     
-    def _on_image_touch(self, widget, touch):
-        """Handle double tap to reset zoom"""
-        if widget.collide_point(*touch.pos):
-            import time
-            current_time = time.time()
-            
-            # Check for double tap
-            if current_time - self.last_touch_time < 0.3:
-                # Reset zoom and position
-                self.scatter.scale = 1
-                self.scatter.pos = (0, 0)
-            
-            self.last_touch_time = current_time
-    
-    def _share_image(self):
-        """Share the current image"""
-        try:
-            success = share_image(str(self.image_path), "Check out this DALL-E image!")
-            if success:
-                Snackbar(text="Opening share dialog...").open()
-            else:
-                Snackbar(text="Failed to share image").open()
-        except Exception as e:
-            Snackbar(text=f"Share error: {str(e)}").open()
-    
-    def _delete_image(self):
-        """Delete the image with confirmation"""
-        from utils.dialogs import ConfirmDialog
-        
-        dialog = ConfirmDialog(
-            title="Delete Image?",
-            text=f"Are you sure you want to delete {self.image_path.name}?",
-            on_confirm=self._confirm_delete
-        )
-        dialog.open()
-    
-    def _confirm_delete(self):
-        """Actually delete the image"""
-        try:
-            os.remove(self.image_path)
-            
-            # Also delete any variations in the same directory
-            for var_path in self.variation_paths:
-                if var_path.exists():
-                    try:
-                        os.remove(var_path)
-                    except:
-                        pass
-            
-            Snackbar(text="Image deleted").open()
-            self.dismiss()
-            
-            # Call callback if provided
-            if self.on_delete_callback:
-                self.on_delete_callback()
-        except Exception as e:
-            Snackbar(text=f"Delete failed: {str(e)}").open()
-    
-    def _on_keyboard(self, window, key, scancode, codepoint, modifier):
-        """Handle keyboard events"""
-        if key == 27:  # ESC or Back button
-            self.dismiss()
-            return True
-        return False
+    def _paths_to_delete(self):
+        """Delete the variations together with the image"""
+        return [self.image_path_str, *self.variation_paths]
     
     def on_dismiss(self):
         """Clean up when dialog is dismissed"""
-        Window.unbind(on_keyboard=self._on_keyboard)
\ No newline at end of file
+        self._set_progress(False)
+        if self.results_preview is not None:
+            for preview_btn in self.results_preview.children:
+                preview_btn.source = ''
+        super().on_dismiss()
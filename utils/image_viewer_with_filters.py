@@ -2,6 +2,7 @@
 Enhanced image viewer with zoom, pan, and filter support
 """
 
+from kivymd.app import MDApp
 from kivymd.uix.dialog import MDDialog
 from kivymd.uix.button import MDFlatButton, MDIconButton, MDRaisedButton
 from kivymd.uix.boxlayout import MDBoxLayout
@@ -9,28 +10,69 @@ from kivymd.uix.slider import MDSlider
 from kivymd.uix.label import MDLabel
 from kivymd.uix.card import MDCard
 from kivy.uix.scatter import Scatter
-from kivy.uix.image import Image
+from kivy.uix.image import AsyncImage
 from kivy.metrics import dp
 from kivy.core.window import Window
+from kivy.clock import Clock
 from kivymd.uix.snackbar import Snackbar
 from kivymd.uix.progressindicator import MDCircularProgressIndicator
+from PIL import Image as PILImage
 from pathlib import Path
+from collections import OrderedDict
+from datetime import datetime
+import hashlib
+import mmap
 import os
 import shutil
+import threading
+import time
 from typing import Optional, Callable
 
 from utils.android_utils import share_image
+from utils.dialogs import ConfirmDialog
+
+
+def _link_or_copy(src, dst):
+    """
+    Make dst a hardlink to src, copying only when linking is not possible.
+    dst is replaced, never written through, so src is never modified.
+    """
+    try:
+        os.unlink(dst)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dst)
+    except (OSError, NotImplementedError):
+        shutil.copy2(src, dst)
 
 
 class ImageViewerWithFilters(MDDialog):
     """Enhanced image viewer with zoom, pan, share, delete, and filter functionality"""
     
+    # Number of filtered results kept on disk for instant re-apply
+    FILTER_CACHE_SIZE = 16
+    
+    # Filters are previewed at (at most) this size; Save renders full-res
+    PREVIEW_SIZE = (1080, 1080)
+    
     def __init__(self, image_path, on_delete_callback=None, **kwargs):
         self.image_path = Path(image_path)
         self.on_delete_callback = on_delete_callback
         self.original_image_path = None
         self.temp_image_path = None
+        self.preview_path = None
+        self._temp_ready = False
         self.processing = False
+        self._kb_bound = False
+        
+        # (source_sha, brightness, contrast, saturation) -> filtered file
+        self._source_sha = None
+        self._filter_cache = OrderedDict()
+        
+        # Debounced live preview; _gen identifies the latest dispatched job
+        self._pending_apply = None
+        self._gen = 0
         
         # Filter values
         self.current_brightness = 0
@@ -48,16 +90,11 @@ class ImageViewerWithFilters(MDDialog):
             **kwargs
         )
         
-        # Bind keyboard
-        Window.bind(on_keyboard=self._on_keyboard)
-        
-        # Create temporary copy of original image
-        self._create_temp_copy()
+        self._app = MDApp.get_running_app()
     
     def _create_temp_copy(self):
-        """Create a temporary copy of the original image"""
-        from kivymd.app import MDApp
-        app = MDApp.get_running_app()
+        """Create a temporary copy of the original image (on first apply)"""
+        app = self._app
         
         if hasattr(app, 'worker_manager'):
             temp_dir = Path(app.data_dir) / 'temp'
@@ -65,7 +102,44 @@ class ImageViewerWithFilters(MDDialog):
             
             self.original_image_path = self.image_path
             self.temp_image_path = temp_dir / f"temp_{self.image_path.name}"
-            shutil.copy2(self.image_path, self.temp_image_path)
+            _link_or_copy(self.image_path, self.temp_image_path)
+            self._temp_ready = True
+            
+            # Preview/hash off the UI thread; both are used once they're set
+            threading.Thread(target=self._prepare_source, daemon=True).start()
+    
+    def _prepare_source(self):
+        """Build the filter preview and the cache hash of the source image"""
+        self._make_preview()
+        self._hash_source()
+    
+    def _make_preview(self):
+        """Write a PREVIEW_SIZE-bounded copy of large sources to preview_path"""
+        preview_path = self.temp_image_path.with_name(f"preview_{self.image_path.name}")
+        try:
+            with PILImage.open(self.image_path) as img:
+                if (img.width <= self.PREVIEW_SIZE[0]
+                        and img.height <= self.PREVIEW_SIZE[1]):
+                    return
+                img.draft(img.mode, self.PREVIEW_SIZE)
+                img.thumbnail(self.PREVIEW_SIZE)
+                img.save(preview_path)
+        except OSError:
+            return
+        self.preview_path = preview_path
+    
+    def _hash_source(self):
+        """Stream a SHA-1 of the source image into _source_sha"""
+        try:
+            with open(self.image_path, 'rb') as f:
+                if hasattr(hashlib, 'file_digest'):
+                    digest = hashlib.file_digest(f, 'sha1')
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        digest = hashlib.sha1(mm)
+        except (OSError, ValueError):
+            return
+        self._source_sha = digest.hexdigest()
     
     def _create_content(self):
         """Create the viewer content with filter controls"""
@@ -135,8 +209,8 @@ class ImageViewerWithFilters(MDDialog):
             size_hint=(1, 1)
         )
         
-        # Image
-        image = Image(
+        # Image (decoded on the loader thread)
+        image = AsyncImage(
             source=str(self.image_path),
             allow_stretch=True,
             keep_ratio=True
@@ -331,16 +405,29 @@ class ImageViewerWithFilters(MDDialog):
         """Update brightness value"""
         self.current_brightness = int(value)
         label.text = f"Brightness: {self.current_brightness}"
+        self._schedule_apply()
     
     def _update_contrast(self, value, label):
         """Update contrast value"""
         self.current_contrast = round(value, 1)
         label.text = f"Contrast: {self.current_contrast}x"
+        self._schedule_apply()
     
     def _update_saturation(self, value, label):
         """Update saturation value"""
         self.current_saturation = round(value, 1)
         label.text = f"Saturation: {self.current_saturation}x"
+        self._schedule_apply()
+    
+    def _schedule_apply(self):
+        """Coalesce rapid slider changes into a single filter run"""
+        if not hasattr(self._app, 'worker_manager'):
+            return
+        if self._pending_apply:
+            self._pending_apply.cancel()
+        self._pending_apply = Clock.schedule_once(
+            lambda dt: self._apply_filters(notify=False), 0.15
+        )
     
     def _reset_filters(self):
         """Reset all filters to default values"""
@@ -348,27 +435,70 @@ class ImageViewerWithFilters(MDDialog):
         self.contrast_slider.value = 1.0
         self.saturation_slider.value = 1.0
         
+        # Drop the preview queued by the slider resets and any job in flight
+        if self._pending_apply:
+            self._pending_apply.cancel()
+            self._pending_apply = None
+        self._gen += 1
+        
         # Reset the image to original
         if self.original_image_path:
             self.image.source = str(self.original_image_path)
             self.image.reload()
     
-    def _apply_filters(self):
+    def _apply_filters(self, notify=True):
         """Apply filters to the image using WorkerManager with proper thread safety"""
+        self._pending_apply = None
+        
+        if (self.current_brightness == 0 and self.current_contrast == 1.0
+                and self.current_saturation == 1.0):
+            # Nothing to apply: show the original and supersede any running job
+            self._gen += 1
+            if self.temp_image_path and not self.processing:
+                _link_or_copy(self.image_path, self.temp_image_path)
+            self.image.source = str(self.image_path)
+            self.image.reload()
+            if notify:
+                Snackbar(text="No filters to apply").open()
+            return
+        
         if self.processing:
-            Snackbar(text="Already processing...").open()
+            if notify:
+                Snackbar(text="Already processing...").open()
+            else:
+                # Retry once the running job has finished
+                self._schedule_apply()
             return
             
-        from kivymd.app import MDApp
-        from kivy.clock import Clock
-        
-        app = MDApp.get_running_app()
+        app = self._app
         
         if not hasattr(app, 'worker_manager'):
             Snackbar(text="Worker system not available").open()
             return
         
+        if self.temp_image_path is None:
+            self._create_temp_copy()
+        
+        settings = (
+            self.current_brightness,
+            self.current_contrast,
+            self.current_saturation
+        )
+        cache_key = (self._source_sha,) + settings
+        cached_path = self._filter_cache.get(cache_key)
+        if cached_path is not None and cached_path.exists():
+            # Same settings already rendered: show them without the worker
+            self._filter_cache.move_to_end(cache_key)
+            _link_or_copy(cached_path, self.temp_image_path)
+            self.image.source = str(self.temp_image_path)
+            self.image.reload()
+            if notify:
+                Snackbar(text="Filters applied successfully").open()
+            return
+        
         # Show progress
+        self._gen += 1
+        gen = self._gen
         self.processing = True
         self.progress.opacity = 1
         self.progress.active = True
@@ -382,11 +512,20 @@ class ImageViewerWithFilters(MDDialog):
                 self.progress.opacity = 0
                 self.progress.active = False
                 
+                if gen != self._gen:
+                    # Superseded (e.g. by a reset) while processing
+                    return
+                
                 if result.get('success'):
+                    self._temp_ready = True
+                    if self._source_sha is not None:
+                        self._cache_filter_result((self._source_sha,) + settings)
+                    
                     # Update displayed image
                     self.image.source = str(self.temp_image_path)
                     self.image.reload()
-                    Snackbar(text="Filters applied successfully").open()
+                    if notify:
+                        Snackbar(text="Filters applied successfully").open()
                 else:
                     error = result.get('error', 'Unknown error')
                     Snackbar(text=f"Filter error: {error}").open()
@@ -394,45 +533,111 @@ class ImageViewerWithFilters(MDDialog):
             # Schedule on main thread
             Clock.schedule_once(update_ui, 0)
         
-        # Apply filters using worker
+        # Apply filters using worker (on the preview once it exists)
         app.worker_manager.process_image_filters(
-            image_path=str(self.original_image_path),
+            image_path=str(self.preview_path or self.original_image_path),
             output_path=str(self.temp_image_path),
-            brightness=self.current_brightness if self.current_brightness != 0 else None,
-            contrast=self.current_contrast if self.current_contrast != 1.0 else None,
-            saturation=self.current_saturation if self.current_saturation != 1.0 else None,
-            callback=on_filter_complete
+            callback=on_filter_complete,
+            **self._filter_values()
         )
     
+    def _filter_values(self):
+        """Current filter values as worker kwargs (None = unchanged)"""
+        return {
+            'brightness': self.current_brightness if self.current_brightness != 0 else None,
+            'contrast': self.current_contrast if self.current_contrast != 1.0 else None,
+            'saturation': self.current_saturation if self.current_saturation != 1.0 else None
+        }
+    
+    def _cache_filter_result(self, cache_key):
+        """Keep a copy of the current filtered image for cache_key"""
+        name = hashlib.sha1(repr(cache_key).encode()).hexdigest()[:16]
+        cached_path = self.temp_image_path.with_name(
+            f"filtered_{name}{self.temp_image_path.suffix}"
+        )
+        try:
+            _link_or_copy(self.temp_image_path, cached_path)
+        except OSError:
+            return
+        
+        self._filter_cache[cache_key] = cached_path
+        self._filter_cache.move_to_end(cache_key)
+        while len(self._filter_cache) > self.FILTER_CACHE_SIZE:
+            _, evicted = self._filter_cache.popitem(last=False)
+            try:
+                os.remove(evicted)
+            except OSError:
+                pass
+    
     def _save_filtered_copy(self):
         """Save a copy of the filtered image"""
-        if not self.temp_image_path or not self.temp_image_path.exists():
+        if not self._temp_ready:
             Snackbar(text="No filters applied yet").open()
             return
         
-        from kivymd.app import MDApp
-        app = MDApp.get_running_app()
+        app = self._app
         
         if hasattr(app, 'data_dir'):
             gallery_dir = Path(app.data_dir) / 'gallery'
             gallery_dir.mkdir(exist_ok=True)
             
             # Generate unique filename
-            from datetime import datetime
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"filtered_{timestamp}_{self.image_path.name}"
             save_path = gallery_dir / filename
             
-            try:
-                shutil.copy2(self.temp_image_path, save_path)
-                Snackbar(text=f"Saved as {filename}").open()
-            except Exception as e:
-                Snackbar(text=f"Save error: {str(e)}").open()
+            filter_values = self._filter_values()
+            if self.preview_path is None or not any(
+                    v is not None for v in filter_values.values()):
+                # Displayed result is already full resolution
+                try:
+                    shutil.copy2(self.temp_image_path, save_path)
+                    Snackbar(text=f"Saved as {filename}").open()
+                except Exception as e:
+                    Snackbar(text=f"Save error: {str(e)}").open()
+                return
+            
+            def on_save_complete(result):
+                if result.get('success'):
+                    Snackbar(text=f"Saved as {filename}").open()
+                else:
+                    error = result.get('error', 'Unknown error')
+                    Snackbar(text=f"Save error: {error}").open()
+            
+            self._render_full_resolution(save_path, on_save_complete)
+    
+    def _render_full_resolution(self, output_path, on_complete):
+        """
+        Re-render the previewed filters from the original image into
+        output_path; on_complete(result) runs on the main thread
+        """
+        if self.processing:
+            Snackbar(text="Already processing...").open()
+            return
+        
+        self.processing = True
+        self.progress.opacity = 1
+        self.progress.active = True
+        
+        def on_render_complete(result):
+            def update_ui(dt):
+                self.processing = False
+                self.progress.opacity = 0
+                self.progress.active = False
+                on_complete(result)
+            
+            Clock.schedule_once(update_ui, 0)
+        
+        self._app.worker_manager.process_image_filters(
+            image_path=str(self.original_image_path),
+            output_path=str(output_path),
+            callback=on_render_complete,
+            **self._filter_values()
+        )
     
     def _on_image_touch(self, widget, touch):
         """Handle double tap to reset zoom"""
         if widget.collide_point(*touch.pos):
-            import time
             current_time = time.time()
             
             # Check for double tap
@@ -444,11 +649,33 @@ class ImageViewerWithFilters(MDDialog):
             self.last_touch_time = current_time
     
     def _share_image(self):
-        """Share the image (filtered or original)"""
+        """Share the image (filtered or original) at full resolution"""
+        filter_values = self._filter_values()
+        if not self._temp_ready or not any(
+                v is not None for v in filter_values.values()):
+            # No filters: share the original
+            self._share_path(self.image_path)
+        elif self.preview_path is None:
+            # Displayed result is already full resolution
+            self._share_path(self.temp_image_path)
+        else:
+            # The display shows the filtered preview; share a full-size render.
+            # It's left in the temp dir since the share target reads it later.
+            share_path = self.temp_image_path.with_name(f"share_{self.image_path.name}")
+            
+            def on_render_complete(result):
+                if result.get('success'):
+                    self._share_path(share_path)
+                else:
+                    error = result.get('error', 'Unknown error')
+                    Snackbar(text=f"Share error: {error}").open()
+            
+            self._render_full_resolution(share_path, on_render_complete)
+    
+    def _share_path(self, path):
+        """Open the share dialog for path"""
         try:
-            # Share the currently displayed image
-            current_source = self.temp_image_path if self.temp_image_path and self.temp_image_path.exists() else self.image_path
-            success = share_image(str(current_source), "Check out this image!")
+            success = share_image(str(path), "Check out this image!")
             if success:
                 Snackbar(text="Opening share dialog...").open()
             else:
@@ -458,8 +685,6 @@ class ImageViewerWithFilters(MDDialog):
     
     def _delete_image(self):
         """Delete the original image with confirmation"""
-        from utils.dialogs import ConfirmDialog
-        
         dialog = ConfirmDialog(
             title="Delete Image?",
             text=f"Are you sure you want to delete {self.image_path.name}?",
@@ -487,13 +712,42 @@ class ImageViewerWithFilters(MDDialog):
             return True
         return False
     
+    def on_open(self):
+        """Bind keyboard while the dialog is shown"""
+        super().on_open()
+        if not self._kb_bound:
+            Window.bind(on_keyboard=self._on_keyboard)
+            self._kb_bound = True
+    
     def on_dismiss(self):
         """Clean up when dialog is dismissed"""
-        Window.unbind(on_keyboard=self._on_keyboard)
+        if self._kb_bound:
+            Window.unbind(on_keyboard=self._on_keyboard)
+            self._kb_bound = False
+        
+        if self._pending_apply:
+            self._pending_apply.cancel()
+            self._pending_apply = None
         
         # Clean up temporary file
-        if self.temp_image_path and self.temp_image_path.exists():
+        if self._temp_ready:
+            self._temp_ready = False
             try:
                 os.remove(self.temp_image_path)
             except:
-                pass
\ No newline at end of file
+                pass
+        
+        # Clean up filter preview
+        if self.preview_path:
+            try:
+                os.remove(self.preview_path)
+            except OSError:
+                pass
+        
+        # Clean up cached filter results
+        for cached_path in self._filter_cache.values():
+            try:
+                os.remove(cached_path)
+            except OSError:
+                pass
+        self._filter_cache.clear()
\ No newline at end of file
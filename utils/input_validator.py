@@ -5,9 +5,33 @@ Prevents injection attacks and ensures data integrity
 
 import re
 import html
+import functools
 from typing import Optional, List
 from kivy.logger import Logger
 
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+
+def _build_automaton(entries):
+    """
+    Build an Aho-Corasick automaton from (keyword, value) pairs
+    Returns None when pyahocorasick is unavailable or there are no keywords
+    """
+    if not AHOCORASICK_AVAILABLE:
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for keyword, value in entries:
+        automaton.add_word(keyword, value)
+    if not len(automaton):
+        return None
+    automaton.make_automaton()
+    return automaton
+
 class InputValidator:
     """
     Comprehensive input validation for security
@@ -27,6 +51,27 @@ class InputValidator:
         # Add inappropriate content filters here
     ]
     
+    # Injection patterns stripped from prompts, fused into a single pass;
+    # the named group tells which kind of attempt was removed
+    _SANITIZE_RE = re.compile(
+        r'(?P<xss><script[^>]*>.*?</script>|javascript:|on\w+\s*=|<iframe|<object)'
+        r'|(?P<sql>\b(?:SELECT|INSERT|UPDATE|DELETE|DROP|UNION|CREATE)\b'
+        r'|--|#|/\*|\*/'
+        r'|[\x00-\x1F\x7F])',  # Control characters
+        re.IGNORECASE | re.DOTALL
+    )
+    
+    # Valid DALL-E image sizes (the tuple keeps the error message order)
+    _SIZE_CHOICES = ("256x256", "512x512", "1024x1024")
+    _VALID_SIZES = frozenset(_SIZE_CHOICES)
+    
+    # Characters html.escape would change
+    _HTML_CHARS_RE = re.compile(r'[<>&"\']')
+    
+    # Filename sanitizing: path separators dropped, other unsafe chars replaced
+    _FILENAME_DELETE = str.maketrans('', '', '/\\')
+    _FILENAME_UNSAFE_RE = re.compile(r'[^a-zA-Z0-9_\-\.]')
+    
     @staticmethod
     def validate_api_key(api_key: str) -> tuple[bool, str]:
         """Validate OpenAI API key format"""
@@ -47,10 +92,16 @@ class InputValidator:
         Sanitize user prompt for DALL-E API
         Returns sanitized prompt and list of issues found
         """
+        prompt, issues = _sanitize_prompt_cached(prompt, max_length)
+        return prompt, list(issues)
+    
+    @staticmethod
+    def _sanitize_prompt(prompt: str, max_length: int) -> tuple[str, tuple]:
+        """Uncached sanitize_prompt; issues are returned as a tuple"""
         issues = []
         
         if not prompt:
-            return "", ["Empty prompt"]
+            return "", ("Empty prompt",)
         
         # Remove leading/trailing whitespace
         prompt = prompt.strip()
@@ -62,55 +113,52 @@ class InputValidator:
             prompt = prompt[:max_length]
             issues.append(f"Prompt truncated to {max_length} characters")
         
-        # Remove potential injection attempts
-        # Remove SQL-like patterns
-        sql_patterns = [
-            r'\b(SELECT|INSERT|UPDATE|DELETE|DROP|UNION|CREATE)\b',
-            r'(--|#|/\*|\*/)',
-            r'[\x00-\x1F\x7F]'  # Control characters
-        ]
-        
-        for pattern in sql_patterns:
-            if re.search(pattern, prompt, re.IGNORECASE):
-                prompt = re.sub(pattern, '', prompt, flags=re.IGNORECASE)
-                issues.append("Removed potential SQL injection attempt")
-        
-        # Remove JavaScript patterns
-        js_patterns = [
-            r'<script[^>]*>.*?</script>',
-            r'javascript:',
-            r'on\w+\s*=',
-            r'<iframe',
-            r'<object'
-        ]
-        
-        for pattern in js_patterns:
-            if re.search(pattern, prompt, re.IGNORECASE):
-                prompt = re.sub(pattern, '', prompt, flags=re.IGNORECASE)
-                issues.append("Removed potential XSS attempt")
-        
-        # HTML escape
-        prompt = html.escape(prompt)
+        # Remove potential injection attempts (SQL-like and JavaScript).
+        # Repeat until nothing matches: removing one pattern can join the
+        # text around it into another ("java--script:" -> "javascript:")
+        found = set()
+        while True:
+            matched = {m.lastgroup
+                       for m in InputValidator._SANITIZE_RE.finditer(prompt)}
+            if not matched:
+                break
+            found |= matched
+            prompt = InputValidator._SANITIZE_RE.sub('', prompt)
+        if 'sql' in found:
+            issues.append("Removed potential SQL injection attempt")
+        if 'xss' in found:
+            issues.append("Removed potential XSS attempt")
+        
+        # HTML escape (most prompts have nothing to escape)
+        if InputValidator._HTML_CHARS_RE.search(prompt):
+            prompt = html.escape(prompt)
         
         # Check for banned content
         prompt_lower = prompt.lower()
-        for word in InputValidator.BANNED_WORDS:
-            if word in prompt_lower:
-                issues.append("Inappropriate content detected")
-                return "", issues
-        
-        # Normalize whitespace
+        if _BANNED_AUTOMATON is not None:
+            banned = next(_BANNED_AUTOMATON.iter(prompt_lower), None) is not None
+        else:
+            banned = any(word in prompt_lower
+                         for word in InputValidator.BANNED_WORDS)
+        if banned:
+            issues.append("Inappropriate content detected")
+            return "", tuple(issues)
+        
+        # Normalize whitespace (split/join is a single pass in C)
         prompt = ' '.join(prompt.split())
         
-        return prompt, issues
+        return prompt, tuple(issues)
+    
+    @staticmethod
+    def clear_prompt_cache():
+        """Drop memoized sanitize_prompt results"""
+        _sanitize_prompt_cached.cache_clear()
     
     @staticmethod
     def validate_image_size(size: str) -> tuple[bool, str]:
         """Validate DALL-E image size parameter"""
-        valid_sizes = ["256x256", "512x512", "1024x1024"]
-        
-        if size not in valid_sizes:
-            return False, f"Invalid size. Must be one of: {', '.join(valid_sizes)}"
+        if size not in InputValidator._VALID_SIZES:
+            return False, f"Invalid size. Must be one of: {', '.join(InputValidator._SIZE_CHOICES)}"
         
         return True, "Valid"
     
@@ -118,12 +166,10 @@ class InputValidator:
     def sanitize_filename(filename: str) -> str:
         """Sanitize filename for saving"""
         # Remove path traversal attempts
-        filename = filename.replace('..', '')
-        filename = filename.replace('/', '')
-        filename = filename.replace('\\', '')
+        filename = filename.translate(InputValidator._FILENAME_DELETE).replace('..', '')
         
         # Keep only safe characters
-        filename = re.sub(r'[^a-zA-Z0-9_\-\.]', '_', filename)
+        filename = InputValidator._FILENAME_UNSAFE_RE.sub('_', filename)
         
         # Limit length
         if len(filename) > 255:
@@ -161,56 +207,82 @@ class InputValidator:
         
         return True, "Valid"
 
+# Repeated prompts (rerolls, undo/redo) skip the regex pipeline
+_sanitize_prompt_cached = functools.lru_cache(maxsize=512)(
+    InputValidator._sanitize_prompt
+)
+
+# Single-pass matcher for BANNED_WORDS (None falls back to substring scans)
+_BANNED_AUTOMATON = _build_automaton(
+    (word, word) for word in InputValidator.BANNED_WORDS
+)
+
 class ContentFilter:
     """
     Content filtering for appropriate use
     """
     
+    # Keyword policies, in reporting priority order
+    _KEYWORD_POLICIES = (
+        ("Content may violate violence policy", (
+            'gore', 'violence', 'blood', 'murder', 'kill',
+            'torture', 'death', 'weapon'
+        )),
+        ("Content may violate adult content policy", (
+            'nude', 'naked', 'nsfw', 'adult', 'explicit'
+        )),
+    )
+    
+    # Hate speech and personal information patterns, fused into one scan;
+    # the named group selects the reason (in reporting priority order)
+    _PATTERN_POLICY_RE = re.compile(
+        r'(?P<hate>(?i:\b(?:hate|racist|discrimination|harass|bully|threat)\b))'
+        r'|(?P<pii>\b\d{3}-\d{2}-\d{4}\b'  # SSN
+        r'|\b\d{16}\b'  # Credit card
+        r'|\b[A-Z]{2}\d{6,8}\b)'  # Passport
+    )
+    _PATTERN_POLICIES = (
+        ('hate', "Content may violate hate speech policy"),
+        ('pii', "Content appears to contain personal information"),
+    )
+    
     @staticmethod
+    @functools.lru_cache(maxsize=512)
     def check_content_policy(prompt: str) -> tuple[bool, str]:
         """
         Check if prompt violates content policy
         Returns (is_allowed, reason)
         """
-        # Check for violent content
-        violence_keywords = [
-            'gore', 'violence', 'blood', 'murder', 'kill',
-            'torture', 'death', 'weapon'
-        ]
-        
         prompt_lower = prompt.lower()
-        for keyword in violence_keywords:
-            if keyword in prompt_lower:
-                return False, "Content may violate violence policy"
-        
-        # Check for adult content
-        adult_keywords = [
-            'nude', 'naked', 'nsfw', 'adult', 'explicit'
-        ]
-        
-        for keyword in adult_keywords:
-            if keyword in prompt_lower:
-                return False, "Content may violate adult content policy"
         
-        # Check for hate speech
-        hate_patterns = [
-            r'\b(hate|racist|discrimination)\b',
-            r'\b(harass|bully|threat)\b'
-        ]
-        
-        for pattern in hate_patterns:
-            if re.search(pattern, prompt_lower):
-                return False, "Content may violate hate speech policy"
-        
-        # Check for personal information
-        pii_patterns = [
-            r'\b\d{3}-\d{2}-\d{4}\b',  # SSN
-            r'\b\d{16}\b',  # Credit card
-            r'\b[A-Z]{2}\d{6,8}\b',  # Passport
-        ]
-        
-        for pattern in pii_patterns:
-            if re.search(pattern, prompt):
-                return False, "Content appears to contain personal information"
+        # Check for violent and adult content
+        if _POLICY_AUTOMATON is not None:
+            hits = {index for _, index in _POLICY_AUTOMATON.iter(prompt_lower)}
+            if hits:
+                return False, ContentFilter._KEYWORD_POLICIES[min(hits)][0]
+        else:
+            for reason, keywords in ContentFilter._KEYWORD_POLICIES:
+                for keyword in keywords:
+                    if keyword in prompt_lower:
+                        return False, reason
+        
+        # Check for hate speech and personal information
+        found = {m.lastgroup
+                 for m in ContentFilter._PATTERN_POLICY_RE.finditer(prompt)}
+        for group, reason in ContentFilter._PATTERN_POLICIES:
+            if group in found:
+                return False, reason
         
         return True, "Content appears appropriate"
+    
+    @staticmethod
+    def clear_policy_cache():
+        """Drop memoized check_content_policy results"""
+        ContentFilter.check_content_policy.cache_clear()
+
+# Single-pass matcher for the keyword policies; values index _KEYWORD_POLICIES
+_POLICY_AUTOMATON = _build_automaton(
+    (keyword, index)
+    for index, (_, keywords) in enumerate(ContentFilter._KEYWORD_POLICIES)
+    for keyword in keywords
+)
@@ -5,17 +5,61 @@ App Integrity Checker - Anti-tampering protection
 import hashlib
 import hmac
 import os
+import re
+import time
+import threading
 from kivy.utils import platform
 from kivy.logger import Logger
 
+# Common root indicators
+ROOT_PATHS = [
+    "/system/app/Superuser.apk",
+    "/sbin/su",
+    "/system/bin/su",
+    "/system/xbin/su",
+    "/data/local/xbin/su",
+    "/data/local/bin/su",
+    "/system/sd/xbin/su",
+    "/system/bin/failsafe/su",
+    "/data/local/su",
+    "/su/bin/su"
+]
+
+def _group_by_parent(paths):
+    """Map each parent directory to the set of file names expected in it"""
+    grouped = {}
+    for path in paths:
+        parent, name = os.path.split(path)
+        grouped.setdefault(parent, set()).add(name)
+    return grouped
+
+# Root indicators grouped so each directory is listed only once
+_ROOT_PATHS_BY_DIR = _group_by_parent(ROOT_PATHS)
+
+# Common emulator indicators: android.os.Build field -> pattern
+_EMULATOR_PATTERNS = (
+    ('FINGERPRINT', re.compile(r'^(?:generic|unknown)')),
+    ('MODEL', re.compile(r'google_sdk|Emulator|Android SDK built for x86')),
+    ('MANUFACTURER', re.compile(r'Genymotion')),
+    ('HARDWARE', re.compile(r'goldfish|ranchu')),
+    ('PRODUCT', re.compile(r'sdk|vbox86p')),  # also google_sdk, sdk_x86
+    ('DEVICE', re.compile(r'generic')),
+)
+
 class IntegrityChecker:
     """
     Verifies app integrity and detects tampering
     """
     
+    # Seconds a successful signature verification stays valid
+    SIGNATURE_CHECK_INTERVAL = 60
+    
     def __init__(self):
         self.package_name = "com.dalleandroid.dalleaiart"
         self.expected_signature = None
+        self._expected_sig_bytes = None
+        self._last_verified = None
+        self._emulator_detected = None  # Build fields are fixed per process
         self.init_integrity_checks()
     
     def init_integrity_checks(self):
@@ -44,21 +88,27 @@ class IntegrityChecker:
             # Get signature
             signatures = package_info.signatures
             if signatures and len(signatures) > 0:
-                self.expected_signature = self._hash_signature(signatures[0])
+                self._expected_sig_bytes = self._signature_bytes(signatures[0])
+                self.expected_signature = hashlib.sha256(self._expected_sig_bytes).hexdigest()
                 Logger.info(f"IntegrityChecker: Initialized with signature hash: {self.expected_signature[:10]}...")
             
         except Exception as e:
             Logger.error(f"IntegrityChecker: Failed to initialize: {e}")
     
-    def _hash_signature(self, signature):
-        """Hash app signature for comparison"""
-        return hashlib.sha256(signature.toByteArray()).hexdigest()
+    def _signature_bytes(self, signature):
+        """Raw signature bytes, copied out of the JNI array once"""
+        return bytes(signature.toByteArray())
     
     def verify_app_signature(self):
         """Verify app signature hasn't changed"""
         if platform != 'android':
             return True  # Skip on non-Android platforms
         
+        # The signature can't change within a process; re-check periodically
+        if (self._last_verified is not None and
+                time.monotonic() - self._last_verified < self.SIGNATURE_CHECK_INTERVAL):
+            return True
+        
         try:
             from jnius import autoclass
             
@@ -74,12 +124,14 @@ class IntegrityChecker:
             
             signatures = package_info.signatures
             if signatures and len(signatures) > 0:
-                current_signature = self._hash_signature(signatures[0])
+                current_bytes = self._signature_bytes(signatures[0])
                 
-                if current_signature != self.expected_signature:
+                if (self._expected_sig_bytes is None or
+                        not hmac.compare_digest(current_bytes, self._expected_sig_bytes)):
                     Logger.error("IntegrityChecker: Signature mismatch - possible tampering!")
                     return False
                 
+            self._last_verified = time.monotonic()
             return True
             
         except Exception as e:
@@ -109,30 +161,21 @@ class IntegrityChecker:
         if platform != 'android':
             return False
         
+        if self._emulator_detected is None:
+            self._emulator_detected = self._detect_emulator()
+        return self._emulator_detected
+    
+    def _detect_emulator(self):
+        """Match android.os.Build fields against emulator indicators"""
         try:
             from jnius import autoclass
             Build = autoclass('android.os.Build')
             
-            # Common emulator indicators
-            emulator_indicators = [
-                Build.FINGERPRINT.startswith("generic"),
-                Build.FINGERPRINT.startswith("unknown"),
-                Build.MODEL.contains("google_sdk"),
-                Build.MODEL.contains("Emulator"),
-                Build.MODEL.contains("Android SDK built for x86"),
-                Build.MANUFACTURER.contains("Genymotion"),
-                Build.HARDWARE.contains("goldfish"),
-                Build.HARDWARE.contains("ranchu"),
-                Build.PRODUCT.contains("sdk"),
-                Build.PRODUCT.contains("google_sdk"),
-                Build.PRODUCT.contains("sdk_x86"),
-                Build.PRODUCT.contains("vbox86p"),
-                Build.DEVICE.contains("generic")
-            ]
-            
-            if any(emulator_indicators):
-                Logger.warning("IntegrityChecker: Emulator detected!")
-                return True
+            # Read each Build field across JNI once, stop at the first hit
+            for field, pattern in _EMULATOR_PATTERNS:
+                if pattern.search(str(getattr(Build, field) or '')):
+                    Logger.warning("IntegrityChecker: Emulator detected!")
+                    return True
                 
         except:
             pass
@@ -145,21 +188,19 @@ class IntegrityChecker:
             return False
         
         # Check for common root indicators
-        root_paths = [
-            "/system/app/Superuser.apk",
-            "/sbin/su",
-            "/system/bin/su",
-            "/system/xbin/su",
-            "/data/local/xbin/su",
-            "/data/local/bin/su",
-            "/system/sd/xbin/su",
-            "/system/bin/failsafe/su",
-            "/data/local/su",
-            "/su/bin/su"
-        ]
-        
-        for path in root_paths:
-            if os.path.exists(path):
+        for parent, names in _ROOT_PATHS_BY_DIR.items():
+            try:
+                with os.scandir(parent) as entries:
+                    found = names.intersection(entry.name for entry in entries)
+            except FileNotFoundError:
+                continue
+            except OSError:
+                # Directory not listable: fall back to probing each path
+                found = {name for name in names
+                         if os.path.exists(os.path.join(parent, name))}
+            
+            if found:
+                path = os.path.join(parent, min(found))
                 Logger.warning(f"IntegrityChecker: Root indicator found: {path}")
                 return True
         
@@ -215,10 +256,13 @@ class IntegrityChecker:
 
 # Global integrity checker instance
 _integrity_checker = None
+_integrity_checker_lock = threading.Lock()
 
 def get_integrity_checker():
     """Get singleton integrity checker instance"""
     global _integrity_checker
     if _integrity_checker is None:
-        _integrity_checker = IntegrityChecker()
+        with _integrity_checker_lock:
+            if _integrity_checker is None:
+                _integrity_checker = IntegrityChecker()
     return _integrity_checker
@@ -5,19 +5,79 @@ consent management, age verification, and data portability.
 """
 
 import os
+import copy
 import json
+import time
+import threading
+import atexit
 import datetime
+import gzip
+import shutil
 import zipfile
 import hashlib
+import hmac
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 from kivy.logger import Logger
 from kivy.utils import platform
-from kivy.clock import Clock
 from kivy.app import App
 
 from .secure_storage import get_secure_storage
 from .storage import get_storage_path
+from ._jsonio import dumps as _dumps, loads as _loads
+
+# Batches of at least this many expired files are deleted in parallel
+UNLINK_POOL_THRESHOLD = 8
+UNLINK_POOL_WORKERS = 4
+
+# Hashed with the user ID to derive the data-deletion token
+_DELETE_PREFIX = b'DELETE_'
+
+
+def _new_user_id():
+    """Generate an anonymous user ID from 32 random bytes"""
+    return hashlib.sha256(os.urandom(32)).hexdigest()[:16]
+
+
+# Local-time "YYYY-MM-DDTHH:MM:SS" prefix for the current second
+_iso_cache = {'sec': None, 'prefix': ''}
+
+def _iso_now():
+    """datetime.now().isoformat() equivalent reusing the per-second prefix"""
+    t = time.time()
+    sec = int(t)
+    if sec != _iso_cache['sec']:
+        _iso_cache['prefix'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(sec))
+        _iso_cache['sec'] = sec
+    return f"{_iso_cache['prefix']}.{int((t - sec) * 1e6):06d}"
+
+
+def _scan_files(directory, suffix):
+    """Yield DirEntry objects for regular files in directory ending in suffix"""
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(suffix) and entry.is_file(follow_symlinks=False):
+                    yield entry
+    except FileNotFoundError:
+        return
+
+
+def _unlink_all(paths):
+    """
+    Delete paths; larger batches are spread over a small thread pool since
+    unlink blocks on the filesystem journal with the GIL released
+    """
+    if len(paths) < UNLINK_POOL_THRESHOLD:
+        for path in paths:
+            os.unlink(path)
+        return
+    
+    with ThreadPoolExecutor(max_workers=UNLINK_POOL_WORKERS) as pool:
+        # Consuming the results re-raises the first unlink error
+        for _ in pool.map(os.unlink, paths):
+            pass
 
 
 class PrivacyManager:
@@ -51,6 +111,10 @@ class PrivacyManager:
         }
     }
     
+    # Flat views of CONSENT_TYPES for the per-call consent lookups
+    _REQUIRED = frozenset(k for k, v in CONSENT_TYPES.items() if v['required'])
+    _DEFAULTS = {k: v['default'] for k, v in CONSENT_TYPES.items()}
+    
     # Minimum age requirements by region
     AGE_REQUIREMENTS = {
         'default': 13,  # COPPA compliance
@@ -58,10 +122,15 @@ class PrivacyManager:
         'us': 13,       # COPPA
     }
     
+    # Audit log size that triggers rotation during data cleanup
+    AUDIT_LOG_MAX_BYTES = 1024 * 1024
+    
     def __init__(self):
         self.secure_storage = get_secure_storage()
         self.privacy_data_file = Path(get_storage_path()) / 'privacy_settings.json'
         self.audit_log_file = Path(get_storage_path()) / 'privacy_audit.log'
+        self._audit_fh = None  # Line-buffered, opened on first event
+        atexit.register(self.sync_audit_log)
         self._load_privacy_settings()
         Logger.info("PrivacyManager: Initialized")
     
@@ -77,24 +146,49 @@ class PrivacyManager:
             'privacy_policy_accepted_date': None,
             'data_retention_days': 365,
             'last_consent_review': None,
-            'user_id': self._get_or_create_user_id()
+            'user_id': None
         }
         
         if self.privacy_data_file.exists():
             try:
-                with open(self.privacy_data_file, 'r') as f:
-                    stored_settings = json.load(f)
+                with open(self.privacy_data_file, 'rb') as f:
+                    stored_settings = _loads(f.read())
                     self.settings.update(stored_settings)
             except Exception as e:
                 Logger.error(f"PrivacyManager: Failed to load settings: {e}")
+        
+        # Secure storage is only consulted when the settings lack a user ID
+        if not self.settings['user_id']:
+            self.settings['user_id'] = self._get_or_create_user_id()
+        
+        # Last persisted state, used to log only what changed
+        self._saved_settings = copy.deepcopy(self.settings)
+        self._update_deletion_token()
+    
+    def _update_deletion_token(self):
+        """Derive the data-deletion confirmation token from the user ID"""
+        self._deletion_token = hashlib.sha256(
+            _DELETE_PREFIX + self.settings['user_id'].encode()
+        ).hexdigest()[:8]
     
     def _save_privacy_settings(self):
-        """Save privacy settings to storage"""
+        """
+        Save privacy settings to storage, synchronously so a consent change
+        survives the process being killed (update_all_consents saves once
+        for the whole batch)
+        """
         try:
             self.privacy_data_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.privacy_data_file, 'w') as f:
-                json.dump(self.settings, f, indent=2)
-            self._log_privacy_event("settings_updated", {"settings": self.settings})
+            tmp_file = self.privacy_data_file.with_suffix('.json.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.write(_dumps(self.settings))
+            os.replace(tmp_file, self.privacy_data_file)
+            
+            # Audit the new values of the settings that changed
+            changed = {key: value for key, value in self.settings.items()
+                       if self._saved_settings.get(key) != value}
+            self._saved_settings = copy.deepcopy(self.settings)
+            self._log_privacy_event("settings_updated", {"changed": changed})
         except Exception as e:
             Logger.error(f"PrivacyManager: Failed to save settings: {e}")
     
@@ -102,54 +196,72 @@ class PrivacyManager:
         """Get or create a unique user ID for privacy tracking"""
         user_id = self.secure_storage.get_data('privacy_user_id')
         if not user_id:
-            # Generate anonymous user ID
-            user_id = hashlib.sha256(
-                f"{datetime.datetime.now().isoformat()}_{os.urandom(16).hex()}".encode()
-            ).hexdigest()[:16]
+            user_id = _new_user_id()
             self.secure_storage.store_data('privacy_user_id', user_id)
         return user_id
     
     def _log_privacy_event(self, event_type: str, details: Dict[str, Any]):
         """Log privacy-related events for audit trail"""
         try:
-            self.audit_log_file.parent.mkdir(parents=True, exist_ok=True)
             log_entry = {
-                'timestamp': datetime.datetime.now().isoformat(),
+                'timestamp': _iso_now(),
                 'user_id': self.settings['user_id'],
                 'event_type': event_type,
                 'details': details
             }
             
-            with open(self.audit_log_file, 'a') as f:
-                f.write(json.dumps(log_entry) + '\n')
+            if self._audit_fh is None:
+                self.audit_log_file.parent.mkdir(parents=True, exist_ok=True)
+                self._audit_fh = open(self.audit_log_file, 'a', buffering=1,
+                                      encoding='utf-8')
+            self._audit_fh.write(json.dumps(log_entry, separators=(',', ':')) + '\n')
         except Exception as e:
             Logger.error(f"PrivacyManager: Failed to log event: {e}")
     
+    def sync_audit_log(self):
+        """Flush the audit log to disk (called at exit; safe to call any time)"""
+        if self._audit_fh is None:
+            return
+        try:
+            self._audit_fh.flush()
+            os.fsync(self._audit_fh.fileno())
+        except (OSError, ValueError) as e:
+            Logger.error(f"PrivacyManager: Failed to sync audit log: {e}")
+    
+    def _close_audit_log(self):
+        """Sync and close the audit log handle; the next event reopens it"""
+        if self._audit_fh is None:
+            return
+        self.sync_audit_log()
+        self._audit_fh.close()
+        self._audit_fh = None
+    
     # Consent Management
     
     def get_consent_status(self, consent_type: str) -> bool:
         """Get consent status for a specific type"""
-        if consent_type not in self.CONSENT_TYPES:
-            return False
-        
         # Required consents are always True
-        if self.CONSENT_TYPES[consent_type]['required']:
+        if consent_type in self._REQUIRED:
             return True
         
-        return self.settings['consent'].get(consent_type, 
-                                           self.CONSENT_TYPES[consent_type]['default'])
+        if consent_type not in self._DEFAULTS:
+            return False
+        
+        return self.settings['consent'].get(consent_type, self._DEFAULTS[consent_type])
     
-    def update_consent(self, consent_type: str, granted: bool):
+    def update_consent(self, consent_type: str, granted: bool, _defer_save: bool = False):
         """Update consent for a specific type"""
-        if consent_type not in self.CONSENT_TYPES:
+        if consent_type not in self._DEFAULTS:
             return False
         
         # Cannot revoke required consents
-        if self.CONSENT_TYPES[consent_type]['required'] and not granted:
+        if consent_type in self._REQUIRED and not granted:
             return False
         
         self.settings['consent'][consent_type] = granted
-        self.settings['last_consent_review'] = datetime.datetime.now().isoformat()
+        self.settings['last_consent_review'] = _iso_now()
+        if _defer_save:
+            return True
         self._save_privacy_settings()
         self._log_privacy_event("consent_updated", {
             "consent_type": consent_type,
@@ -159,20 +271,27 @@ class PrivacyManager:
     
     def get_all_consents(self) -> Dict[str, bool]:
         """Get all consent statuses"""
-        consents = {}
-        for consent_type in self.CONSENT_TYPES:
-            consents[consent_type] = self.get_consent_status(consent_type)
-        return consents
+        consent = self.settings['consent']
+        return {
+            consent_type: consent_type in self._REQUIRED or consent.get(consent_type, default)
+            for consent_type, default in self._DEFAULTS.items()
+        }
     
     def update_all_consents(self, consents: Dict[str, bool]):
         """Update multiple consents at once"""
-        for consent_type, granted in consents.items():
-            self.update_consent(consent_type, granted)
+        changes = [
+            {"consent_type": consent_type, "granted": granted}
+            for consent_type, granted in consents.items()
+            if self.update_consent(consent_type, granted, _defer_save=True)
+        ]
+        if changes:
+            self._save_privacy_settings()
+            self._log_privacy_event("consents_updated_bulk", {"changes": changes})
     
     def reset_consents_to_minimum(self):
         """Reset all consents to minimum required (GDPR compliance)"""
-        for consent_type, config in self.CONSENT_TYPES.items():
-            if not config['required']:
+        for consent_type in self._DEFAULTS:
+            if consent_type not in self._REQUIRED:
                 self.settings['consent'][consent_type] = False
         self._save_privacy_settings()
         self._log_privacy_event("consents_reset", {"reason": "user_request"})
@@ -183,15 +302,16 @@ class PrivacyManager:
         """Verify user age meets requirements"""
         try:
             today = datetime.date.today()
-            age = today.year - birth_date.year - (
-                (today.month, today.day) < (birth_date.month, birth_date.day)
-            )
+            # Month/day packed as MMDD so the birthday check is one int compare
+            today_md = today.month * 100 + today.day
+            birth_md = birth_date.month * 100 + birth_date.day
+            age = today.year - birth_date.year - (today_md < birth_md)
             
             min_age = self.AGE_REQUIREMENTS.get(region, self.AGE_REQUIREMENTS['default'])
             
             if age >= min_age:
                 self.settings['age_verified'] = True
-                self.settings['age_verification_date'] = datetime.datetime.now().isoformat()
+                self.settings['age_verification_date'] = _iso_now()
                 self.settings['user_region'] = region
                 self._save_privacy_settings()
                 self._log_privacy_event("age_verified", {
@@ -227,7 +347,7 @@ class PrivacyManager:
         """Record privacy policy acceptance"""
         self.settings['privacy_policy_accepted'] = True
         self.settings['privacy_policy_version'] = version
-        self.settings['privacy_policy_accepted_date'] = datetime.datetime.now().isoformat()
+        self.settings['privacy_policy_accepted_date'] = _iso_now()
         self._save_privacy_settings()
         self._log_privacy_event("privacy_policy_accepted", {"version": version})
     
@@ -250,38 +370,44 @@ class PrivacyManager:
             timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
             export_file = export_dir / f'user_data_export_{timestamp}.zip'
             
-            with zipfile.ZipFile(export_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+            with zipfile.ZipFile(export_file, 'w', zipfile.ZIP_DEFLATED,
+                                 compresslevel=1) as zf:
                 # Privacy settings
-                zf.writestr('privacy_settings.json', 
-                           json.dumps(self.settings, indent=2))
+                zf.writestr('privacy_settings.json', _dumps(self.settings))
                 
                 # Secure storage data (excluding encryption keys)
                 secure_data = {
                     'api_key_stored': bool(self.secure_storage.get_api_key()),
                     'user_id': self.settings['user_id']
                 }
-                zf.writestr('secure_data.json', 
-                           json.dumps(secure_data, indent=2))
+                zf.writestr('secure_data.json', _dumps(secure_data))
                 
-                # Audit log
+                # Audit log, plus rotated archives stored as-is (already gzipped)
                 if self.audit_log_file.exists():
                     zf.write(self.audit_log_file, 'privacy_audit.log')
+                for entry in _scan_files(self.audit_log_file.parent, '.log.gz'):
+                    if entry.name.startswith('privacy_audit_'):
+                        zf.write(entry.path, entry.name,
+                                 compress_type=zipfile.ZIP_STORED)
                 
                 # Generated images metadata
                 images_dir = Path(get_storage_path()) / 'images'
-                if images_dir.exists():
-                    image_metadata = []
-                    for img_file in images_dir.glob('*.png'):
-                        metadata = {
-                            'filename': img_file.name,
-                            'size': img_file.stat().st_size,
-                            'created': datetime.datetime.fromtimestamp(
-                                img_file.stat().st_ctime
-                            ).isoformat()
-                        }
-                        image_metadata.append(metadata)
-                    zf.writestr('images_metadata.json', 
-                               json.dumps(image_metadata, indent=2))
+                if images_dir.is_dir():
+                    # Streamed as a JSON array so memory doesn't grow with the gallery
+                    with zf.open('images_metadata.json', 'w', force_zip64=True) as out:
+                        separator = b'['
+                        for entry in _scan_files(images_dir, '.png'):
+                            st = entry.stat()
+                            metadata = {
+                                'filename': entry.name,
+                                'size': st.st_size,
+                                'created': datetime.datetime.fromtimestamp(
+                                    st.st_ctime
+                                ).isoformat()
+                            }
+                            out.write(separator + _dumps(metadata))
+                            separator = b','
+                        out.write(b']' if separator == b',' else b'[]')
                 
                 # App settings and preferences
                 app = App.get_running_app()
@@ -289,8 +415,7 @@ class PrivacyManager:
                     config_data = {}
                     for section in app.config.sections():
                         config_data[section] = dict(app.config.items(section))
-                    zf.writestr('app_config.json', 
-                               json.dumps(config_data, indent=2))
+                    zf.writestr('app_config.json', _dumps(config_data))
             
             self._log_privacy_event("data_exported", {"export_file": str(export_file)})
             return str(export_file)
@@ -302,11 +427,11 @@ class PrivacyManager:
     def delete_all_user_data(self, confirm_token: str = None) -> bool:
         """Delete all user data (GDPR right to erasure)"""
         # Require confirmation token to prevent accidental deletion
-        expected_token = hashlib.sha256(
-            f"DELETE_{self.settings['user_id']}".encode()
-        ).hexdigest()[:8]
+        expected_token = self._deletion_token
         
-        if confirm_token != expected_token:
+        # Compare as bytes: compare_digest rejects non-ASCII str arguments
+        if not isinstance(confirm_token, str) or not hmac.compare_digest(
+                confirm_token.encode(), expected_token.encode()):
             Logger.warning(f"PrivacyManager: Invalid deletion token. Expected: {expected_token}")
             return False
         
@@ -314,7 +439,7 @@ class PrivacyManager:
             # Log deletion request first
             self._log_privacy_event("data_deletion_requested", {
                 "user_id": self.settings['user_id'],
-                "timestamp": datetime.datetime.now().isoformat()
+                "timestamp": _iso_now()
             })
             
             # Clear secure storage
@@ -338,9 +463,7 @@ class PrivacyManager:
                 app.config.write()
             
             # Archive audit log (don't delete for legal compliance)
-            if self.audit_log_file.exists():
-                archive_file = self.audit_log_file.with_suffix('.archived')
-                self.audit_log_file.rename(archive_file)
+            self._rotate_audit_log()
             
             Logger.info("PrivacyManager: All user data deleted successfully")
             return True
@@ -349,22 +472,35 @@ class PrivacyManager:
             Logger.error(f"PrivacyManager: Failed to delete data: {e}")
             return False
     
+    def _rotate_audit_log(self):
+        """Archive the audit log as a timestamped gzip; the next event starts a new log"""
+        self._close_audit_log()
+        if not self.audit_log_file.exists():
+            return
+        
+        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        archive_file = self.audit_log_file.with_name(f'privacy_audit_{timestamp}.log.gz')
+        # Appending adds a gzip member, so a same-second rotation never overwrites
+        with open(self.audit_log_file, 'rb') as fin, \
+                gzip.open(archive_file, 'ab', compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, length=1 << 20)
+        self.audit_log_file.unlink()
+    
     def get_deletion_token(self) -> str:
         """Get token required for data deletion"""
-        return hashlib.sha256(
-            f"DELETE_{self.settings['user_id']}".encode()
-        ).hexdigest()[:8]
+        return self._deletion_token
     
     def anonymize_data(self):
         """Anonymize user data instead of deleting"""
         try:
             # Generate new anonymous user ID
-            new_user_id = hashlib.sha256(os.urandom(32)).hexdigest()[:16]
+            new_user_id = _new_user_id()
             
             # Update user ID everywhere
             old_user_id = self.settings['user_id']
             self.settings['user_id'] = new_user_id
             self.secure_storage.store_data('privacy_user_id', new_user_id)
+            self._update_deletion_token()
             
             # Clear personal identifiers
             self.settings['age_verification_date'] = None
@@ -388,22 +524,30 @@ class PrivacyManager:
         try:
             retention_days = self.settings.get('data_retention_days', 365)
             cutoff_date = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+            cutoff_ts = cutoff_date.timestamp()
             
             # Clean old images
             images_dir = Path(get_storage_path()) / 'images'
-            if images_dir.exists():
-                for img_file in images_dir.glob('*.png'):
-                    if datetime.datetime.fromtimestamp(img_file.stat().st_mtime) < cutoff_date:
-                        img_file.unlink()
-                        Logger.info(f"PrivacyManager: Deleted old image: {img_file.name}")
+            expired = [entry for entry in _scan_files(images_dir, '.png')
+                       if entry.stat().st_mtime < cutoff_ts]
+            _unlink_all([entry.path for entry in expired])
+            for entry in expired:
+                Logger.info(f"PrivacyManager: Deleted old image: {entry.name}")
             
             # Clean old exports
             export_dir = Path(get_storage_path()) / 'exports'
-            if export_dir.exists():
-                for export_file in export_dir.glob('*.zip'):
-                    if datetime.datetime.fromtimestamp(export_file.stat().st_mtime) < cutoff_date:
-                        export_file.unlink()
-                        Logger.info(f"PrivacyManager: Deleted old export: {export_file.name}")
+            expired = [entry for entry in _scan_files(export_dir, '.zip')
+                       if entry.stat().st_mtime < cutoff_ts]
+            _unlink_all([entry.path for entry in expired])
+            for entry in expired:
+                Logger.info(f"PrivacyManager: Deleted old export: {entry.name}")
+            
+            # Rotate an oversized audit log
+            try:
+                if os.stat(self.audit_log_file).st_size > self.AUDIT_LOG_MAX_BYTES:
+                    self._rotate_audit_log()
+            except FileNotFoundError:
+                pass
             
             self._log_privacy_event("data_cleanup", {
                 "retention_days": retention_days,
@@ -440,17 +584,20 @@ class PrivacyManager:
     
     def mark_consent_reviewed(self):
         """Mark consents as reviewed"""
-        self.settings['last_consent_review'] = datetime.datetime.now().isoformat()
+        self.settings['last_consent_review'] = _iso_now()
         self._save_privacy_settings()
         self._log_privacy_event("consent_reviewed", {})
 
 
 # Singleton instance
 _privacy_manager = None
+_privacy_manager_lock = threading.Lock()
 
 def get_privacy_manager():
     """Get singleton instance of PrivacyManager"""
     global _privacy_manager
     if _privacy_manager is None:
-        _privacy_manager = PrivacyManager()
+        with _privacy_manager_lock:
+            if _privacy_manager is None:
+                _privacy_manager = PrivacyManager()
     return _privacy_manager
\ No newline at end of file
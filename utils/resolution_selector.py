@@ -8,8 +8,41 @@ from kivymd.uix.button import MDFlatButton, MDRaisedButton
 from kivymd.uix.label import MDLabel
 from kivymd.uix.card import MDCard
 from kivy.metrics import dp
+from kivy.lang import Builder
 from kivy.properties import StringProperty, ObjectProperty
 
+# Per-size option (button over its cost caption), compiled once
+KV = '''
+<_SizeOption>:
+    orientation: 'vertical'
+    size_hint_x: 1
+    
+    MDRaisedButton:
+        id: button
+        text: root.label
+        on_release: root.selector._select_size(root.size_key)
+    
+    MDLabel:
+        text: root.caption
+        theme_text_color: "Secondary"
+        font_style: "Caption"
+        halign: "center"
+        size_hint_y: None
+        height: dp(20)
+'''
+
+
+class _SizeOption(MDBoxLayout):
+    """One ResolutionSelector choice; the layout lives in the KV rule above"""
+    
+    size_key = StringProperty()
+    label = StringProperty()
+    caption = StringProperty()
+    selector = ObjectProperty(None)
+
+
+Builder.load_string(KV)
+
 
 class ResolutionSelector(MDCard):
     """Resolution selector widget for DALL-E image generation"""
@@ -24,6 +57,10 @@ class ResolutionSelector(MDCard):
         "1024x1024": {"label": "1024×1024", "cost": "$$$", "desc": "High Quality"}
     }
     
+    # Button backgrounds for the selected/unselected states
+    _SELECTED_BG = (0.5, 0.5, 1, 0.8)
+    _UNSELECTED_BG = (0.5, 0.5, 0.5, 0.3)
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.orientation = 'vertical'
@@ -70,39 +107,23 @@ class ResolutionSelector(MDCard):
         )
         
         for size, info in self.SIZES.items():
-            # Create button container
-            btn_container = MDBoxLayout(
-                orientation='vertical',
-                size_hint_x=1
-            )
-            
-            # Size button
-            btn = MDRaisedButton(
-                text=info['label'],
-                on_release=lambda x, s=size: self._select_size(s)
+            # Size button with its cost indicator
+            option = _SizeOption(
+                size_key=size,
+                label=info['label'],
+                caption=f"{info['cost']} {info['desc']}",
+                selector=self
             )
+            btn = option.ids.button
             
             # Set default selection
             if size == self.selected_size:
-                btn.md_bg_color = (0.5, 0.5, 1, 0.8)
+                btn.md_bg_color = self._SELECTED_BG
             else:
-                btn.md_bg_color = (0.5, 0.5, 0.5, 0.3)
+                btn.md_bg_color = self._UNSELECTED_BG
             
-            btn_container.add_widget(btn)
             self.size_buttons[size] = btn
-            
-            # Cost indicator
-            cost_label = MDLabel(
-                text=f"{info['cost']} {info['desc']}",
-                theme_text_color="Secondary",
-                font_style="Caption",
-                halign="center",
-                size_hint_y=None,
-                height=dp(20)
-            )
-            btn_container.add_widget(cost_label)
-            
-            button_box.add_widget(btn_container)
+            button_box.add_widget(option)
         
         self.add_widget(button_box)
         
@@ -122,12 +143,11 @@ class ResolutionSelector(MDCard):
         if size == self.selected_size:
             return
         
-        # Update button appearances
-        for s, btn in self.size_buttons.items():
-            if s == size:
-                btn.md_bg_color = (0.5, 0.5, 1, 0.8)
-            else:
-                btn.md_bg_color = (0.5, 0.5, 0.5, 0.3)
+        # Update the appearance of the two buttons that change state
+        previous = self.size_buttons.get(self.selected_size)
+        if previous is not None:
+            previous.md_bg_color = self._UNSELECTED_BG
+        self.size_buttons[size].md_bg_color = self._SELECTED_BG
         
         self.selected_size = size
         self.info_label.text = self._get_size_info(size)
@@ -161,6 +181,10 @@ class CompactResolutionSelector(MDBoxLayout):
     selected_size = StringProperty("1024x1024")
     on_size_change = ObjectProperty(None)
     
+    # Button backgrounds for the selected/unselected states
+    _SELECTED_BG = (0.5, 0.5, 1, 0.3)
+    _UNSELECTED_BG = (0, 0, 0, 0)
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.orientation = 'horizontal'
@@ -191,7 +215,7 @@ class CompactResolutionSelector(MDBoxLayout):
             )
             
             if full_size == self.selected_size:
-                btn.md_bg_color = (0.5, 0.5, 1, 0.3)
+                btn.md_bg_color = self._SELECTED_BG
             
             self.add_widget(btn)
             self.size_buttons[full_size] = btn
@@ -201,12 +225,11 @@ class CompactResolutionSelector(MDBoxLayout):
         if size == self.selected_size:
             return
         
-        # Update buttons
-        for s, btn in self.size_buttons.items():
-            if s == size:
-                btn.md_bg_color = (0.5, 0.5, 1, 0.3)
-            else:
-                btn.md_bg_color = (0, 0, 0, 0)
+        # Update the two buttons that change state
+        previous = self.size_buttons.get(self.selected_size)
+        if previous is not None:
+            previous.md_bg_color = self._UNSELECTED_BG
+        self.size_buttons[size].md_bg_color = self._SELECTED_BG
         
         self.selected_size = size
         
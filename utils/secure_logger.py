@@ -3,11 +3,15 @@ Secure Logging Implementation
 Prevents sensitive data leakage in logs
 """
 
+import os
 import re
 import logging
-from functools import wraps
+from functools import lru_cache, wraps
 from kivy.logger import Logger as KivyLogger
 
+# Production builds set PRODUCTION=1; read once at import
+_PRODUCTION = os.environ.get('PRODUCTION', '0') == '1'
+
 class SecureLogger:
     """
     Logger that redacts sensitive information
@@ -23,22 +27,47 @@ class SecureLogger:
         (r'Bearer [a-zA-Z0-9\-._~+/]+=*', 'Bearer ***REDACTED***'),  # Bearer tokens
     ]
     
+    # Literal each of SENSITIVE_PATTERNS needs in order to match
+    # (None: the pattern needs a digit)
+    _PATTERN_TRIGGERS = ('sk-', None, None, '@', '"password"', 'Bearer ')
+    _DIGIT_RE = re.compile(r'\d')
+    
+    # SENSITIVE_PATTERNS compiled once. They are applied one after another,
+    # not fused: a replacement can create a boundary a later pattern needs
+    # (e.g. a digit run glued to a redacted API key).
+    _COMPILED_PATTERNS = [
+        (re.compile(pattern), replacement) for pattern, replacement in SENSITIVE_PATTERNS
+    ]
+    
     def __init__(self, name='DALLE-App'):
         self.name = name
-        self.production_mode = self._is_production()
-    
-    def _is_production(self):
-        """Check if running in production mode"""
-        import os
-        return os.environ.get('PRODUCTION', '0') == '1'
+        self.production_mode = _PRODUCTION
+        # Level gates resolved once; suppressed calls return before formatting
+        self._log_debug = self._should_log('DEBUG')
+        self._log_info = self._should_log('INFO')
     
     def _redact_sensitive_data(self, message: str) -> str:
         """Redact sensitive information from log messages"""
         if not isinstance(message, str):
             message = str(message)
         
-        for pattern, replacement in self.SENSITIVE_PATTERNS:
-            message = re.sub(pattern, replacement, message)
+        # Only patterns whose trigger occurs can match; most messages have
+        # none. Replacements add no digits or triggers, so checking the
+        # original message is enough.
+        has_digit = None
+        active = []
+        for i, trigger in enumerate(self._PATTERN_TRIGGERS):
+            if trigger is None:
+                if has_digit is None:
+                    has_digit = self._DIGIT_RE.search(message) is not None
+                if has_digit:
+                    active.append(i)
+            elif trigger in message:
+                active.append(i)
+        
+        for i in active:
+            pattern, replacement = self._COMPILED_PATTERNS[i]
+            message = pattern.sub(replacement, message)
         
         return message
     
@@ -51,15 +80,17 @@ class SecureLogger:
     
     def debug(self, message: str, *args, **kwargs):
         """Log debug message"""
-        if self._should_log('DEBUG'):
-            safe_message = self._redact_sensitive_data(message)
-            KivyLogger.debug(f"{self.name}: {safe_message}")
+        if not self._log_debug:
+            return
+        safe_message = self._redact_sensitive_data(message)
+        KivyLogger.debug(f"{self.name}: {safe_message}")
     
     def info(self, message: str, *args, **kwargs):
         """Log info message"""
-        if self._should_log('INFO'):
-            safe_message = self._redact_sensitive_data(message)
-            KivyLogger.info(f"{self.name}: {safe_message}")
+        if not self._log_info:
+            return
+        safe_message = self._redact_sensitive_data(message)
+        KivyLogger.info(f"{self.name}: {safe_message}")
     
     def warning(self, message: str, *args, **kwargs):
         """Log warning message"""
@@ -82,21 +113,28 @@ class SecureLogger:
             safe_message = self._redact_sensitive_data(message)
             KivyLogger.critical(f"{self.name}: {safe_message}")
 
+@lru_cache(maxsize=16)
+def _get_logger(name):
+    """Shared SecureLogger per name for the function-call decorator"""
+    return SecureLogger(name)
+
 def log_function_call(logger_name='DALLE-App'):
     """
     Decorator to log function calls securely
     """
-    logger = SecureLogger(logger_name)
+    logger = _get_logger(logger_name)
     
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             # Log function entry (debug only)
-            logger.debug(f"Entering {func.__name__}")
+            if logger._log_debug:
+                logger.debug(f"Entering {func.__name__}")
             
             try:
                 result = func(*args, **kwargs)
-                logger.debug(f"Exiting {func.__name__} successfully")
+                if logger._log_debug:
+                    logger.debug(f"Exiting {func.__name__} successfully")
                 return result
             except Exception as e:
                 # Log error without exposing sensitive details
@@ -108,4 +146,4 @@ def log_function_call(logger_name='DALLE-App'):
     return decorator
 
 # Create global secure logger instance
-secure_logger = SecureLogger('DALLE-App')
+secure_logger = _get_logger('DALLE-App')
@@ -4,15 +4,36 @@ Implements encrypted storage for sensitive data like API keys
 """
 
 import os
-import json
 import base64
+import hashlib
 from pathlib import Path
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from kivy.logger import Logger
 from kivy.utils import platform
 
+from ._jsonio import dumps as _dumps, loads as _loads, read_bytes as _read_bytes
+
+# Data file layout: version byte, 12-byte nonce, AES-GCM ciphertext + tag.
+# Files written before this start with a Fernet token (b'gAAAA...').
+_AEAD_VERSION = b'\x01'
+_NONCE_SIZE = 12
+
+
+def _aead_for(key: bytes):
+    """AES-256-GCM cipher keyed from the stored Fernet key (domain-separated)"""
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    raw = base64.urlsafe_b64decode(key)
+    return AESGCM(hashlib.sha256(b'secure_data.aesgcm\x00' + raw).digest())
+
+
+# Storage directories already created and restricted this session
+_initialized_paths = set()
+
+
+def _open_private(path):
+    """Open path for binary writing, creating it owner read/write only"""
+    return open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb')
+
+
 class SecureStorage:
     """Secure storage for sensitive application data"""
     
@@ -22,6 +43,9 @@ class SecureStorage:
         self.key_file = self.storage_dir / "app.key"
         self.data_file = self.storage_dir / "secure_data.enc"
         self.cipher = self._initialize_cipher()
+        # Decrypted data and the (mtime_ns, size) of the file it came from
+        self._cache = None
+        self._cache_stamp = None
         Logger.info(f"SecureStorage: Initialized for {app_name}")
     
     def _get_secure_storage_path(self):
@@ -33,21 +57,30 @@ class SecureStorage:
             # For desktop testing
             path = Path.home() / f'.{self.app_name}' / '.secure'
         
+        if path in _initialized_paths:
+            return path
+        
         # Create directory with restricted permissions
         path.mkdir(parents=True, exist_ok=True)
         if platform != 'android':
             os.chmod(path, 0o700)  # Owner read/write/execute only
         
+        _initialized_paths.add(path)
         return path
     
     def _initialize_cipher(self):
         """Initialize or load encryption cipher"""
+        # cryptography loads OpenSSL bindings; imported on first use
+        from cryptography.fernet import Fernet
+        
         if self.key_file.exists():
             # Load existing key
             try:
                 with open(self.key_file, 'rb') as f:
                     key = f.read()
-                return Fernet(key)
+                cipher = Fernet(key)
+                self._aead = _aead_for(key)
+                return cipher
             except Exception as e:
                 Logger.error(f"SecureStorage: Failed to load key: {e}")
                 # Generate new key if loading fails
@@ -57,57 +90,18 @@ class SecureStorage:
     
     def _generate_new_key(self):
         """Generate a new encryption key"""
-        # Use device-specific salt if available
-        salt = self._get_device_salt()
-        
-        # Generate key using PBKDF2
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
+        from cryptography.fernet import Fernet
         
-        # Use a combination of app name and random data
-        password = f"{self.app_name}_{os.urandom(16).hex()}".encode()
-        key = base64.urlsafe_b64encode(kdf.derive(password))
+        # Fernet keys are 32 random bytes already; no derivation step needed
+        key = Fernet.generate_key()
         
         # Store key securely
-        with open(self.key_file, 'wb') as f:
+        with _open_private(self.key_file) as f:
             f.write(key)
         
-        if platform != 'android':
-            os.chmod(self.key_file, 0o600)  # Owner read/write only
-        
+        self._aead = _aead_for(key)
         return Fernet(key)
     
-    def _get_device_salt(self):
-        """Get device-specific salt for key generation"""
-        if platform == 'android':
-            try:
-                from jnius import autoclass
-                Build = autoclass('android.os.Build')
-                # Use Android ID as part of salt
-                device_id = f"{Build.SERIAL}_{Build.FINGERPRINT}"
-                return device_id.encode()[:16]  # Use first 16 bytes
-            except:
-                pass
-        
-        # Fallback to random salt
-        salt = os.urandom(16)
-        salt_file = self.storage_dir / "device.salt"
-        
-        if salt_file.exists():
-            with open(salt_file, 'rb') as f:
-                salt = f.read()
-        else:
-            with open(salt_file, 'wb') as f:
-                f.write(salt)
-            if platform != 'android':
-                os.chmod(salt_file, 0o600)
-        
-        return salt
-    
     def store_api_key(self, api_key):
         """Securely store the API key"""
         try:
@@ -131,37 +125,64 @@ class SecureStorage:
         # Load existing data
         data = self._load_all_data()
         
+        # Nothing to write if the value is already stored
+        if key in data and data[key] == value:
+            return
+        
         # Update with new value
+        data = dict(data)
         data[key] = value
         
         # Encrypt and save
-        encrypted_data = self.cipher.encrypt(json.dumps(data).encode())
-        
-        with open(self.data_file, 'wb') as f:
-            f.write(encrypted_data)
-        
-        if platform != 'android':
-            os.chmod(self.data_file, 0o600)
+        self._write_all_data(data)
     
     def get_data(self, key, default=None):
         """Retrieve decrypted data"""
         data = self._load_all_data()
         return data.get(key, default)
     
+    def _data_stamp(self):
+        """(mtime_ns, size) of the data file, or None if it doesn't exist"""
+        try:
+            st = os.stat(self.data_file)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+    
     def _load_all_data(self):
-        """Load and decrypt all stored data"""
-        if not self.data_file.exists():
-            return {}
-        
+        """Load all stored data, decrypting only if the file changed"""
+        stamp = self._data_stamp()
+        if self._cache is None or stamp != self._cache_stamp:
+            self._cache = self._read_all_data() if stamp else {}
+            self._cache_stamp = stamp
+        return self._cache
+    
+    def _write_all_data(self, data):
+        """Encrypt and write data, keeping it as the cached copy"""
+        nonce = os.urandom(_NONCE_SIZE)
+        encrypted_data = self._aead.encrypt(nonce, _dumps(data), None)
+        with _open_private(self.data_file) as f:
+            f.write(_AEAD_VERSION + nonce + encrypted_data)
+        self._cache = data
+        self._cache_stamp = self._data_stamp()
+    
+    def _read_all_data(self):
+        """Read and decrypt all stored data"""
         try:
-            with open(self.data_file, 'rb') as f:
-                encrypted_data = f.read()
+            encrypted_data = _read_bytes(self.data_file)
             
             if not encrypted_data:
                 return {}
             
-            decrypted_data = self.cipher.decrypt(encrypted_data)
-            return json.loads(decrypted_data.decode())
+            if encrypted_data[:1] == _AEAD_VERSION:
+                nonce = encrypted_data[1:1 + _NONCE_SIZE]
+                decrypted_data = self._aead.decrypt(
+                    nonce, encrypted_data[1 + _NONCE_SIZE:], None
+                )
+            else:
+                # Fernet-encrypted file; rewritten as AES-GCM on the next store
+                decrypted_data = self.cipher.decrypt(encrypted_data)
+            return _loads(decrypted_data)
         except Exception as e:
             Logger.error(f"SecureStorage: Failed to load data: {e}")
             return {}
@@ -174,13 +195,14 @@ class SecureStorage:
     def remove_data(self, key):
         """Remove specific data"""
         data = self._load_all_data()
-        data.pop(key, None)
+        if key not in data:
+            return
+        data = dict(data)
+        del data[key]
         
         if data:
             # Re-encrypt remaining data
-            encrypted_data = self.cipher.encrypt(json.dumps(data).encode())
-            with open(self.data_file, 'wb') as f:
-                f.write(encrypted_data)
+            self._write_all_data(data)
         else:
             # Remove file if no data left
             if self.data_file.exists():
@@ -193,6 +215,7 @@ class SecureStorage:
                 self.data_file.unlink()
             if self.key_file.exists():
                 self.key_file.unlink()
+            self._cache = None
             Logger.info("SecureStorage: All data cleared")
             return True
         except Exception as e:
@@ -210,9 +233,7 @@ class SecureStorage:
             
             # Re-encrypt with new key
             if data:
-                encrypted_data = self.cipher.encrypt(json.dumps(data).encode())
-                with open(self.data_file, 'wb') as f:
-                    f.write(encrypted_data)
+                self._write_all_data(data)
             
             Logger.info("SecureStorage: Encryption key rotated successfully")
             return True
@@ -4,31 +4,71 @@ Secure storage for API keys and generation history using encryption
 
 import os
 import json
+from collections import deque
+from functools import lru_cache
 from datetime import datetime
+from itertools import islice
 from typing import List, Dict, Optional, Any
-from cryptography.fernet import Fernet
 from kivy.utils import platform
 
+from ._jsonio import dumps as _dumps, loads as _loads, read_bytes as _read_bytes
+
+# Decrypted history per history file: path -> (file stamp, deque of entries
+# newest first). Screens create short-lived SecureStorage objects, so it is
+# shared.
+_history_cache = {}
+
+# Lowercased prompts for search: path -> (cached history deque, prompts).
+# Reloads store a new deque and appends update both in place, so identity
+# tells if it's current.
+_prompt_index = {}
+
+
+@lru_cache(maxsize=1)
+def get_storage_path():
+    """
+    App-private storage directory shared by the storage-backed modules
+    (resolved and created once per session)
+    """
+    if platform == 'android':
+        from android.storage import app_storage_path
+        return app_storage_path()
+    else:
+        # For desktop testing
+        home = os.path.expanduser('~')
+        storage_dir = os.path.join(home, '.dalle_app')
+        os.makedirs(storage_dir, exist_ok=True)
+        return storage_dir
+
+
+def _file_stamp(path):
+    """(mtime_ns, size) of path, or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
 class SecureStorage:
+    # Maximum number of history entries kept
+    HISTORY_LIMIT = 100
+    
     def __init__(self):
         self.storage_dir = self._get_storage_dir()
         self.key_file = os.path.join(self.storage_dir, '.key')
         self.data_file = os.path.join(self.storage_dir, '.data')
         self.history_file = os.path.join(self.storage_dir, '.history')
         self.cipher = self._get_cipher()
+        self._history_records = None  # Records in the history log, once known
     
     def _get_storage_dir(self):
-        if platform == 'android':
-            from android.storage import app_storage_path
-            return app_storage_path()
-        else:
-            # For desktop testing
-            home = os.path.expanduser('~')
-            storage_dir = os.path.join(home, '.dalle_app')
-            os.makedirs(storage_dir, exist_ok=True)
-            return storage_dir
+        return get_storage_path()
     
     def _get_cipher(self):
+        # cryptography loads OpenSSL bindings; imported on first use
+        from cryptography.fernet import Fernet
+        
         if os.path.exists(self.key_file):
             with open(self.key_file, 'rb') as f:
                 key = f.read()
@@ -78,29 +118,22 @@ class SecureStorage:
             True if saved successfully
         """
         try:
-            # Load existing history
-            history = self._load_history()
-            
-            # Create new entry
+            # Create new entry (id and timestamp share one clock read)
+            now = datetime.now()
+            settings = settings or {}
             entry = {
-                'id': datetime.now().strftime('%Y%m%d_%H%M%S_%f'),
-                'timestamp': datetime.now().isoformat(),
+                'id': now.strftime('%Y%m%d_%H%M%S_%f'),
+                'timestamp': now.isoformat(),
                 'prompt': prompt,
                 'image_url': image_url,
                 'image_path': image_path,
-                'settings': settings or {},
-                'size': settings.get('size', '512x512') if settings else '512x512',
-                'model': settings.get('model', 'dall-e-2') if settings else 'dall-e-2'
+                'settings': settings,
+                'size': settings.get('size', '512x512'),
+                'model': settings.get('model', 'dall-e-2')
             }
             
-            # Add to history (newest first)
-            history.insert(0, entry)
-            
-            # Limit history size to prevent unbounded growth
-            history = history[:100]
-            
-            # Save history
-            self._save_history(history)
+            # Append to the history log (compacted to the newest entries)
+            self._append_history(entry)
             
             return True
             
@@ -119,7 +152,7 @@ class SecureStorage:
             List of history entries (newest first)
         """
         history = self._load_history()
-        return history[:limit]
+        return list(islice(history, limit))
     
     def search_history(self, query: str) -> List[Dict[str, Any]]:
         """
@@ -134,10 +167,16 @@ class SecureStorage:
         query_lower = query.lower()
         history = self._load_history()
         
+        index = _prompt_index.get(self.history_file)
+        if index is None or index[0] is not history:
+            index = (history, deque((entry.get('prompt', '').lower() for entry in history),
+                                    maxlen=self.HISTORY_LIMIT))
+            _prompt_index[self.history_file] = index
+        
         # Filter by prompt containing query
         results = [
-            entry for entry in history
-            if query_lower in entry.get('prompt', '').lower()
+            entry for entry, prompt in zip(history, index[1])
+            if query_lower in prompt
         ]
         
         return results
@@ -152,6 +191,8 @@ class SecureStorage:
         try:
             if os.path.exists(self.history_file):
                 os.remove(self.history_file)
+            self._history_records = 0
+            _history_cache.pop(self.history_file, None)
             return True
         except Exception as e:
             print(f"Error clearing history: {e}")
@@ -173,44 +214,122 @@ class SecureStorage:
                 return entry
         return None
     
-    def _load_history(self) -> List[Dict[str, Any]]:
-        """Load history from file"""
-        if not os.path.exists(self.history_file):
+    # The history file is an append-only log: one Fernet token per line, each
+    # holding a single entry, oldest first. Older files hold one JSON value
+    # (an encrypted string or a plain list) and are rewritten as a log on the
+    # next save.
+    
+    def _read_history_records(self) -> Optional[List[bytes]]:
+        """Raw log records, or None if the file is in the older format"""
+        try:
+            data = _read_bytes(self.history_file)
+        except FileNotFoundError:
             return []
         
+        if data.lstrip()[:1] in (b'"', b'['):
+            return None
+        return data.split()
+    
+    def _load_history(self) -> deque:
+        """Load history (newest first), decrypting only if the file changed"""
+        stamp = _file_stamp(self.history_file)
+        cached = _history_cache.get(self.history_file)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        
+        history = deque(self._read_history()[:self.HISTORY_LIMIT],
+                        maxlen=self.HISTORY_LIMIT)
+        _history_cache[self.history_file] = (stamp, history)
+        return history
+    
+    def _read_history(self) -> List[Dict[str, Any]]:
+        """Read and decrypt history from file (newest first)"""
+        from cryptography.fernet import InvalidToken
+        
         try:
-            with open(self.history_file, 'r') as f:
-                data = json.load(f)
-                # Handle both encrypted and unencrypted history
-                if isinstance(data, str):
-                    # Encrypted history
-                    decrypted = self.cipher.decrypt(data.encode()).decode()
-                    return json.loads(decrypted)
-                else:
-                    # Unencrypted history (for compatibility)
-                    return data
+            records = self._read_history_records()
+            if records is None:
+                return self._load_legacy_history()
+            
+            self._history_records = len(records)
+            history = []
+            for record in reversed(records[-self.HISTORY_LIMIT:]):
+                try:
+                    history.append(_loads(self.cipher.decrypt(record)))
+                except (InvalidToken, ValueError):
+                    # Skip a record torn by an interrupted append
+                    continue
+            return history
         except Exception as e:
             print(f"Error loading history: {e}")
             return []
     
-    def _save_history(self, history: List[Dict[str, Any]]) -> None:
-        """Save history to file (encrypted)"""
-        try:
-            # Convert to JSON
-            history_json = json.dumps(history)
-            
-            # Encrypt
-            encrypted = self.cipher.encrypt(history_json.encode()).decode()
-            
-            # Save
-            with open(self.history_file, 'w') as f:
-                json.dump(encrypted, f)
-                
-        except Exception as e:
-            print(f"Error saving history: {e}")
-            # Fallback to unencrypted save
-            try:
-                with open(self.history_file, 'w') as f:
-                    json.dump(history, f)
-            except:
-                pass
\ No newline at end of file
+    def _load_legacy_history(self) -> List[Dict[str, Any]]:
+        """Load history saved as a single JSON value"""
+        with open(self.history_file, 'r') as f:
+            data = json.load(f)
+            # Handle both encrypted and unencrypted history
+            if isinstance(data, str):
+                # Encrypted history
+                decrypted = self.cipher.decrypt(data.encode()).decode()
+                return json.loads(decrypted)
+            else:
+                # Unencrypted history (for compatibility)
+                return data
+    
+    def _append_history(self, entry: Dict[str, Any]) -> None:
+        """Append one encrypted entry to the history log"""
+        if self._history_records is None:
+            records = self._read_history_records()
+            if records is None:
+                # Migrate an older file, then the log takes over
+                history = deque(self._load_history(), maxlen=self.HISTORY_LIMIT)
+                history.appendleft(entry)
+                self._save_history(history)
+                return
+            self._history_records = len(records)
+        
+        # Keep the cached history current if it reflects the file pre-append
+        cached = _history_cache.get(self.history_file)
+        if cached is not None and cached[0] != _file_stamp(self.history_file):
+            cached = None
+        
+        record = self.cipher.encrypt(_dumps(entry))
+        with open(self.history_file, 'ab') as f:
+            f.write(record + b'\n')
+        self._history_records += 1
+        
+        # Drop superseded entries once they outnumber the live ones
+        if self._history_records > 2 * self.HISTORY_LIMIT:
+            self._compact_history()
+        
+        if cached is None:
+            _history_cache.pop(self.history_file, None)
+        else:
+            history = cached[1]
+            history.appendleft(entry)
+            index = _prompt_index.get(self.history_file)
+            if index is not None and index[0] is history:
+                index[1].appendleft(entry.get('prompt', '').lower())
+            _history_cache[self.history_file] = (_file_stamp(self.history_file), history)
+    
+    def _compact_history(self) -> None:
+        """Rewrite the log keeping only the newest HISTORY_LIMIT records"""
+        records = self._read_history_records() or []
+        records = records[-self.HISTORY_LIMIT:]
+        self._write_history_records(records)
+    
+    def _save_history(self, history: deque) -> None:
+        """Save history (newest first, capped deque) to file as an encrypted log"""
+        records = [self.cipher.encrypt(_dumps(entry))
+                   for entry in reversed(history)]
+        self._write_history_records(records)
+        _history_cache[self.history_file] = (_file_stamp(self.history_file), history)
+    
+    def _write_history_records(self, records: List[bytes]) -> None:
+        """Atomically replace the history log with records"""
+        tmp_file = self.history_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(b''.join(record + b'\n' for record in records))
+        os.replace(tmp_file, self.history_file)
+        self._history_records = len(records)
\ No newline at end of file
@@ -3,36 +3,67 @@ Workers Package for DALL-E Android App
 Enhanced background task processing system with Kivy integration
 """
 
-from .base_worker import BaseWorker, WorkerState, WorkerPriority
-from .image_processor import ImageProcessingWorker, FilterType
-from .settings_sync import SettingsSyncWorker, SyncOperation
-from .api_request import APIRequestWorker, APIRequestType
-from .worker_manager import WorkerManager
+import importlib
+
+# Public names -> submodule defining them; nothing is imported until first use
+_LAZY_ATTRS = {
+    'BaseWorker': '.base_worker',
+    'WorkerState': '.base_worker',
+    'WorkerPriority': '.base_worker',
+    'ImageProcessingWorker': '.image_processor',
+    'FilterType': '.image_processor',
+    'SettingsSyncWorker': '.settings_sync',
+    'SyncOperation': '.settings_sync',
+    'APIRequestWorker': '.api_request',
+    'APIRequestType': '.api_request',
+    'WorkerManager': '.worker_manager',
+    
+    # Enhanced components (None if unavailable)
+    'BaseWorkerEnhanced': '.base_worker_enhanced',
+    'WorkerTask': '.base_worker_enhanced',
+    
+    # Kivy integration (None if unavailable)
+    'KivyWorkerBridge': '.kivy_worker_bridge',
+    'WorkerTaskWrapper': '.kivy_worker_bridge',
+    'KivyWorkerMixin': '.kivy_worker_bridge',
+    'create_kivy_safe_callback': '.kivy_worker_bridge',
+}
+
+# Feature flags -> the optional submodule they report on
+_FEATURE_FLAGS = {
+    'ENHANCED_AVAILABLE': '.base_worker_enhanced',
+    'KIVY_INTEGRATION_AVAILABLE': '.kivy_worker_bridge',
+}
+
+
+def _import_optional(module):
+    """Import an optional submodule, or None if its dependencies are missing"""
+    try:
+        return importlib.import_module(module, __name__)
+    except ImportError:
+        return None
+
+
+def __getattr__(name):
+    """Resolve public names on first access (PEP 562) and cache them"""
+    if name in _FEATURE_FLAGS:
+        value = _import_optional(_FEATURE_FLAGS[name]) is not None
+    elif name in _LAZY_ATTRS:
+        module = _LAZY_ATTRS[name]
+        if module in _FEATURE_FLAGS.values():
+            loaded = _import_optional(module)
+            value = getattr(loaded, name) if loaded is not None else None
+        else:
+            value = getattr(importlib.import_module(module, __name__), name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    globals()[name] = value
+    return value
 
-# Import enhanced components if available
-try:
-    from .base_worker_enhanced import BaseWorkerEnhanced, WorkerTask
-    ENHANCED_AVAILABLE = True
-except ImportError:
-    ENHANCED_AVAILABLE = False
-    BaseWorkerEnhanced = None
-    WorkerTask = None
 
-# Import Kivy integration if available
-try:
-    from .kivy_worker_bridge import (
-        KivyWorkerBridge, 
-        WorkerTaskWrapper, 
-        KivyWorkerMixin,
-        create_kivy_safe_callback
-    )
-    KIVY_INTEGRATION_AVAILABLE = True
-except ImportError:
-    KIVY_INTEGRATION_AVAILABLE = False
-    KivyWorkerBridge = None
-    WorkerTaskWrapper = None
-    KivyWorkerMixin = None
-    create_kivy_safe_callback = None
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
 
 __all__ = [
     # Base classes
@@ -5,15 +5,26 @@ Handles DALL-E API calls with retry logic and rate limiting
 
 import time
 import json
+import heapq
+import random
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, Any, Optional, List
 from dataclasses import dataclass
 from enum import Enum
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 import threading
+from collections import Counter, deque
 
 from .base_worker import BaseWorker, WorkerPriority
 
+try:
+    from requests_toolbelt.multipart.encoder import MultipartEncoder
+    TOOLBELT_AVAILABLE = True
+except ImportError:
+    TOOLBELT_AVAILABLE = False
+
 class APIRequestType(Enum):
     GENERATE_IMAGE = "generate_image"
     CREATE_VARIATION = "create_variation"
@@ -35,34 +46,78 @@ class APIRequest:
     retry_count: int = 0
     max_retries: int = 3
 
+class APIError(Exception):
+    """Non-200 API response; retry_after is the server's Retry-After in seconds"""
+    
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+# Token counts are kept in millionths so the bucket state is all integers
+_TOKEN_SCALE = 1_000_000
+
 class RateLimiter:
     """Token bucket rate limiter"""
     
     def __init__(self, rate: int, per: int):
         self.rate = rate  # Number of requests
         self.per = per    # Per seconds
-        self.tokens = rate
-        self.last_update = time.time()
-        self.lock = threading.Lock()
+        self._capacity = rate * _TOKEN_SCALE
+        # (tokens in millionths, last update in monotonic ns), replaced as a
+        # whole so readers never see a half-updated bucket
+        self._state = (self._capacity, time.monotonic_ns())
+        self._state_lock = threading.Lock()
+        
+    @property
+    def tokens(self) -> float:
+        """Tokens available as of the last acquire"""
+        return self._state[0] / _TOKEN_SCALE
         
     def acquire(self, tokens: int = 1) -> float:
         """Acquire tokens, returns wait time if rate limited"""
-        with self.lock:
-            now = time.time()
-            elapsed = now - self.last_update
+        wanted = tokens * _TOKEN_SCALE
+        while True:
+            state = self._state
+            current, last_update = state
+            now = time.monotonic_ns()
             
-            # Add tokens based on elapsed time
-            self.tokens = min(self.rate, self.tokens + elapsed * (self.rate / self.per))
-            self.last_update = now
+            # Add tokens based on elapsed time (monotonic, so clock jumps
+            # neither drain nor overfill the bucket)
+            elapsed = max(0, now - last_update)
+            available = min(self._capacity,
+                            current + elapsed * self.rate * _TOKEN_SCALE // (self.per * 1_000_000_000))
             
-            if self.tokens >= tokens:
-                self.tokens -= tokens
-                return 0.0  # No wait
+            if available >= wanted:
+                new_state = (available - wanted, now)
+                wait_time = 0.0  # No wait
             else:
                 # Calculate wait time
-                deficit = tokens - self.tokens
-                wait_time = deficit * (self.per / self.rate)
-                return wait_time
+                new_state = (available, now)
+                wait_time = (wanted - available) / _TOKEN_SCALE * (self.per / self.rate)
+            
+            # Compare-and-swap: the lock covers only the swap, and a bucket
+            # changed by another thread since it was read is recomputed
+            with self._state_lock:
+                if self._state is state:
+                    self._state = new_state
+                    return wait_time
 
 class APIRequestWorker(BaseWorker):
     """
@@ -70,16 +125,28 @@ class APIRequestWorker(BaseWorker):
     retry logic, and request batching.
     """
     
+    # Models whose generations endpoint accepts n > 1 (dall-e-3 only takes 1)
+    BATCHABLE_MODELS = ("dall-e-2",)
+    
     def __init__(self, api_key: str, base_url: str = "https://api.openai.com/v1"):
         super().__init__("APIRequest", max_queue_size=100)
         self.api_key = api_key
         self.base_url = base_url
         self.rate_limiter = RateLimiter(rate=50, per=60)  # 50 requests per minute
-        self.request_history = []
         self.max_history = 1000
+        self.request_history = deque(maxlen=self.max_history)  # Oldest evicted on append
+        # Running totals over request_history, kept in step by _record_request
+        self._stats = {"total": 0, "success": 0, "retries": 0, "by_type": Counter()}
         
-        # Retry configuration
-        self.retry_delays = [1, 2, 5]  # Exponential backoff
+        # Retry configuration: exponential backoff with full jitter, so
+        # clients that failed together don't retry in lockstep
+        self.retry_base = 1.0
+        self.retry_cap = 30.0
+        
+        # Batching: queued generations with the same prompt and settings are
+        # sent as one call with a summed n, collected over a short window
+        self.batch_max = 10  # API limit on n per call
+        self.batch_window_ms = 50
         
         # Headers for API requests
         self.headers = {
@@ -87,18 +154,80 @@ class APIRequestWorker(BaseWorker):
             "Content-Type": "application/json"
         }
         
+        # Pooled session so requests reuse TCP/TLS connections to the API;
+        # retries stay in process_task. Content-Type is left per request
+        # (json= sets it, multipart uploads need their own boundary).
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32,
+                                                   max_retries=0))
+        self.session.headers["Authorization"] = self.headers["Authorization"]
+        
     def process_task(self, request: APIRequest) -> Dict[str, Any]:
         """Process API request with retry logic"""
         
+        # Identical generation requests still queued ride along in this call
+        batch = []
+        if (request.request_type == APIRequestType.GENERATE_IMAGE
+                and request.model in self.BATCHABLE_MODELS
+                and request.n < self.batch_max
+                and self.queue.qsize() > 0):
+            # Only worth waiting for more when others are already queued
+            time.sleep(self.batch_window_ms / 1000)
+            batch = self.drain_batch(request)
+        n = request.n + sum(queued.n for queued in batch)
+        
+        try:
+            return self._process_request(request, batch, n)
+        finally:
+            # Drained requests are finished here, not by the worker loop
+            for _ in batch:
+                self.queue.task_done()
+        
+    def drain_batch(self, request: APIRequest) -> List[APIRequest]:
+        """
+        Remove and return queued generation requests that can share an API
+        call with request (same prompt, model, size and quality), highest
+        priority first, up to batch_max images in total
+        """
+        key = (request.prompt, request.model, request.size, request.quality)
+        budget = self.batch_max - request.n
+        batch = []
+        
+        with self.queue.mutex:
+            heap = self.queue.queue
+            kept = []
+            for item in sorted(heap, key=lambda item: item[:2]):
+                queued = item[2]
+                if (budget > 0
+                        and isinstance(queued, APIRequest)
+                        and queued.request_type == APIRequestType.GENERATE_IMAGE
+                        and queued.n <= budget
+                        and (queued.prompt, queued.model, queued.size, queued.quality) == key):
+                    batch.append(queued)
+                    budget -= queued.n
+                else:
+                    kept.append(item)
+            if batch:
+                heap[:] = kept
+                heapq.heapify(heap)
+                self.queue.not_full.notify(len(batch))
+        
+        if batch:
+            self.logger.info(f"Batched {len(batch)} queued request(s) into one call")
+        return batch
+        
+    def _process_request(self, request: APIRequest, batch: List[APIRequest], n: int) -> Dict[str, Any]:
+        """Send request (with any batched requests, n images in all) and deliver results"""
+        
         # Wait for rate limit if needed
-        wait_time = self.rate_limiter.acquire(request.n)
+        wait_time = self.rate_limiter.acquire(n)
         if wait_time > 0:
             self.logger.info(f"Rate limited, waiting {wait_time:.2f}s")
             time.sleep(wait_time)
             
         try:
             if request.request_type == APIRequestType.GENERATE_IMAGE:
-                result = self._generate_image(request)
+                result = self._generate_image(request, n)
             elif request.request_type == APIRequestType.CREATE_VARIATION:
                 result = self._create_variation(request)
             elif request.request_type == APIRequestType.EDIT_IMAGE:
@@ -106,69 +235,105 @@ class APIRequestWorker(BaseWorker):
             else:
                 raise ValueError(f"Unknown request type: {request.request_type}")
                 
-            # Record successful request
-            self._record_request(request, result, success=True)
-            
-            # Call callback if provided
-            if request.callback:
-                request.callback(result)
-                
-            return result
-            
         except Exception as e:
             # Handle retry logic
-            if request.retry_count < request.max_retries:
-                delay = self.retry_delays[min(request.retry_count, len(self.retry_delays) - 1)]
-                self.logger.warning(f"Request failed, retrying in {delay}s: {str(e)}")
+            # Identity, not ==: batched requests are equal dataclasses
+            retrying = {id(r) for r in [request] + batch if r.retry_count < r.max_retries}
+            if retrying:
+                expo = min(self.retry_cap, self.retry_base * (2 ** request.retry_count))
+                delay = random.uniform(0, expo)
+                # Never retry sooner than the server asked to
+                retry_after = getattr(e, 'retry_after', None)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                self.logger.warning(f"Request failed, retrying in {delay:.2f}s: {str(e)}")
                 
                 time.sleep(delay)
-                request.retry_count += 1
                 
-                # Re-queue the request
-                self.add_task(request, WorkerPriority.HIGH)
-                return None
-            else:
-                # Max retries exceeded
-                self.logger.error(f"Request failed after {request.max_retries} retries: {str(e)}")
-                error_result = {
-                    "success": False,
-                    "error": str(e),
-                    "request_type": request.request_type.value,
-                    "retries": request.retry_count
-                }
-                
-                self._record_request(request, error_result, success=False)
-                
-                if request.callback:
-                    request.callback(error_result)
+            for failed in [request] + batch:
+                if id(failed) in retrying:
+                    failed.retry_count += 1
+                    
+                    # Re-queue the request
+                    self.add_task(failed, WorkerPriority.HIGH)
+                else:
+                    # Max retries exceeded
+                    self.logger.error(f"Request failed after {failed.max_retries} retries: {str(e)}")
+                    error_result = {
+                        "success": False,
+                        "error": str(e),
+                        "request_type": failed.request_type.value,
+                        "retries": failed.retry_count
+                    }
+                    
+                    self._record_request(failed, error_result, success=False)
                     
-                return None
+                    if failed.callback:
+                        failed.callback(error_result)
+                    
+            return None
+            
+        # Delivery is outside the retry path: a failing callback must not
+        # re-send requests whose images were already delivered
+        if batch:
+            result = self._fan_out(request, batch, result)
+            
+        # Record successful request
+        self._record_request(request, result, success=True)
+        
+        # Call callback if provided
+        if request.callback:
+            request.callback(result)
+            
+        return result
                 
-    def _generate_image(self, request: APIRequest) -> Dict[str, Any]:
-        """Generate image using DALL-E API"""
+    def _fan_out(self, request: APIRequest, batch: List[APIRequest], result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Split a batched call's images across the requests that made it;
+        delivers each batched request's share and returns request's own
+        """
+        images = result["images"]
+        own = dict(result, images=images[:request.n])
+        start = request.n
+        for queued in batch:
+            share = dict(result, images=images[start:start + queued.n])
+            start += queued.n
+            
+            self._record_request(queued, share, success=True)
+            self.completed_tasks += 1
+            # One failing callback must not keep the rest from their images
+            try:
+                if queued.callback:
+                    queued.callback(share)
+                if self.on_task_complete:
+                    self.on_task_complete(queued, share)
+            except Exception as e:
+                self.logger.error(f"Error delivering batched result: {str(e)}", exc_info=True)
+        return own
+                
+    def _generate_image(self, request: APIRequest, n: Optional[int] = None) -> Dict[str, Any]:
+        """Generate image using DALL-E API (n overrides request.n for batched calls)"""
         endpoint = f"{self.base_url}/images/generations"
+        n = request.n if n is None else n
         
         payload = {
             "model": request.model,
             "prompt": request.prompt,
-            "n": request.n,
+            "n": n,
             "size": request.size,
             "quality": request.quality,
             "response_format": "url"  # or "b64_json"
         }
         
-        self.logger.info(f"Generating {request.n} image(s) with prompt: {request.prompt[:50]}...")
+        self.logger.info(f"Generating {n} image(s) with prompt: {request.prompt[:50]}...")
         
-        response = requests.post(
+        response = self.session.post(
             endpoint,
-            headers=self.headers,
             json=payload,
             timeout=60
         )
         
-        if response.status_code != 200:
-            error_data = response.json()
-            raise Exception(f"API Error: {error_data.get('error', {}).get('message', 'Unknown error')}")
+        self._check_response(response)
             
         data = response.json()
         
@@ -186,32 +351,19 @@ class APIRequestWorker(BaseWorker):
         """Create image variation using DALL-E API"""
         endpoint = f"{self.base_url}/images/variations"
         
-        with open(request.image_path, 'rb') as image_file:
-            files = {
-                'image': ('image.png', image_file, 'image/png')
-            }
-            
-            data = {
-                'model': request.model,
-                'n': request.n,
-                'size': request.size,
-                'response_format': 'url'
-            }
-            
-            # Remove Content-Type header for multipart/form-data
-            headers = {k: v for k, v in self.headers.items() if k != "Content-Type"}
-            
-            response = requests.post(
-                endpoint,
-                headers=headers,
-                files=files,
-                data=data,
-                timeout=60
-            )
-            
-        if response.status_code != 200:
-            error_data = response.json()
-            raise Exception(f"API Error: {error_data.get('error', {}).get('message', 'Unknown error')}")
+        files = {
+            'image': ('image.png', request.image_path, 'image/png')
+        }
+        
+        data = {
+            'model': request.model,
+            'n': request.n,
+            'size': request.size,
+            'response_format': 'url'
+        }
+        
+        response = self._post_multipart(endpoint, files, data)
+        self._check_response(response)
             
         data = response.json()
         
@@ -229,38 +381,24 @@ class APIRequestWorker(BaseWorker):
         """Edit image using DALL-E API"""
         endpoint = f"{self.base_url}/images/edits"
         
-        with open(request.image_path, 'rb') as image_file:
-            files = {
-                'image': ('image.png', image_file, 'image/png')
-            }
-            
-            # Add mask if provided
-            if request.mask_path:
-                with open(request.mask_path, 'rb') as mask_file:
-                    files['mask'] = ('mask.png', mask_file, 'image/png')
-                    
-            data = {
-                'model': request.model,
-                'prompt': request.prompt,
-                'n': request.n,
-                'size': request.size,
-                'response_format': 'url'
-            }
-            
-            # Remove Content-Type header for multipart/form-data
-            headers = {k: v for k, v in self.headers.items() if k != "Content-Type"}
-            
-            response = requests.post(
-                endpoint,
-                headers=headers,
-                files=files,
-                data=data,
-                timeout=60
-            )
-            
-        if response.status_code != 200:
-            error_data = response.json()
-            raise Exception(f"API Error: {error_data.get('error', {}).get('message', 'Unknown error')}")
+        files = {
+            'image': ('image.png', request.image_path, 'image/png')
+        }
+        
+        # Add mask if provided
+        if request.mask_path:
+            files['mask'] = ('mask.png', request.mask_path, 'image/png')
+                
+        data = {
+            'model': request.model,
+            'prompt': request.prompt,
+            'n': request.n,
+            'size': request.size,
+            'response_format': 'url'
+        }
+        
+        response = self._post_multipart(endpoint, files, data)
+        self._check_response(response)
             
         data = response.json()
         
@@ -276,6 +414,55 @@ class APIRequestWorker(BaseWorker):
             "timestamp": datetime.now().isoformat()
         }
         
+    def _post_multipart(self, endpoint: str, files: Dict[str, tuple], data: Dict[str, Any]) -> requests.Response:
+        """
+        POST a multipart form; files maps field -> (filename, path, mime type).
+        With requests-toolbelt the body is streamed from disk instead of
+        being assembled in memory.
+        """
+        handles = []
+        try:
+            opened = {}
+            for field, (filename, path, mime) in files.items():
+                handle = open(path, 'rb')
+                handles.append(handle)
+                opened[field] = (filename, handle, mime)
+                
+            if TOOLBELT_AVAILABLE:
+                fields = {key: str(value) for key, value in data.items()}
+                fields.update(opened)
+                encoder = MultipartEncoder(fields=fields)
+                return self.session.post(
+                    endpoint,
+                    data=encoder,
+                    headers={"Content-Type": encoder.content_type},
+                    timeout=60
+                )
+                
+            # Session headers carry no Content-Type, so multipart sets its own
+            return self.session.post(
+                endpoint,
+                files=opened,
+                data=data,
+                timeout=60
+            )
+        finally:
+            for handle in handles:
+                handle.close()
+        
+    def _check_response(self, response: requests.Response):
+        """Raise APIError for a non-200 response"""
+        if response.status_code == 200:
+            return
+        error_data = response.json()
+        retry_after = None
+        if response.status_code in (429, 503):
+            retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+        raise APIError(
+            f"API Error: {error_data.get('error', {}).get('message', 'Unknown error')}",
+            response.status_code, retry_after
+        )
+        
     def _record_request(self, request: APIRequest, result: Dict[str, Any], success: bool):
         """Record request for history and analytics"""
         record = {
@@ -291,11 +478,23 @@ class APIRequestWorker(BaseWorker):
         if success and 'images' in result:
             record['image_count'] = len(result['images'])
             
+        # The full deque drops its oldest record on append; take it out of
+        # the totals first
+        if len(self.request_history) == self.max_history:
+            self._count_record(self.request_history[0], -1)
         self.request_history.append(record)
+        self._count_record(record, 1)
         
-        # Maintain max history size
-        if len(self.request_history) > self.max_history:
-            self.request_history = self.request_history[-self.max_history:]
+    def _count_record(self, record: Dict[str, Any], sign: int):
+        """Add (sign=1) or remove (sign=-1) a history record from the stats totals"""
+        stats = self._stats
+        stats["total"] += sign
+        stats["success"] += sign * record['success']
+        stats["retries"] += sign * record['retry_count']
+        by_type = stats["by_type"]
+        by_type[record['request_type']] += sign
+        if not by_type[record['request_type']]:
+            del by_type[record['request_type']]
             
     def add_generation_request(self, prompt: str, 
                              n: int = 1,
@@ -335,7 +534,9 @@ class APIRequestWorker(BaseWorker):
         
     def get_request_stats(self) -> Dict[str, Any]:
         """Get API request statistics"""
-        if not self.request_history:
+        stats = self._stats
+        total = stats["total"]
+        if not total:
             return {
                 "total_requests": 0,
                 "success_rate": 0.0,
@@ -343,22 +544,11 @@ class APIRequestWorker(BaseWorker):
                 "average_retry_count": 0.0
             }
             
-        total = len(self.request_history)
-        successful = sum(1 for r in self.request_history if r['success'])
-        
-        requests_by_type = {}
-        total_retries = 0
-        
-        for record in self.request_history:
-            req_type = record['request_type']
-            requests_by_type[req_type] = requests_by_type.get(req_type, 0) + 1
-            total_retries += record['retry_count']
-            
         return {
             "total_requests": total,
-            "success_rate": successful / total if total > 0 else 0.0,
-            "requests_by_type": requests_by_type,
-            "average_retry_count": total_retries / total if total > 0 else 0.0,
+            "success_rate": stats["success"] / total,
+            "requests_by_type": dict(stats["by_type"]),
+            "average_retry_count": stats["retries"] / total,
             "rate_limit_tokens": self.rate_limiter.tokens
         }
         
@@ -366,4 +556,16 @@ class APIRequestWorker(BaseWorker):
         """Update API key"""
         self.api_key = new_api_key
         self.headers["Authorization"] = f"Bearer {new_api_key}"
+        self.session.headers["Authorization"] = self.headers["Authorization"]
         self.logger.info("API key updated")
+        
+    def _run(self):
+        """Worker loop; the connection pool is released when it exits"""
+        try:
+            super()._run()
+        finally:
+            self.close()
+        
+    def close(self):
+        """Close the HTTP session and its connection pool"""
+        self.session.close()
@@ -4,6 +4,7 @@ Handles image filters and transformations asynchronously
 """
 
 import io
+import os
 import time
 from typing import Dict, Any, Optional, Tuple
 from PIL import Image, ImageEnhance, ImageFilter
@@ -24,6 +25,12 @@ class FilterType(Enum):
     SEPIA = "sepia"
     INVERT = "invert"
 
+# Adjustments that are batched into a single LUT/vectorized pass
+TONE_FILTERS = (FilterType.BRIGHTNESS, FilterType.CONTRAST, FilterType.SATURATION)
+
+# ITU-R 601-2 luma weights, as used by PIL's "L" conversion
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
 @dataclass
 class ImageTask:
     """Represents an image processing task"""
@@ -60,8 +67,12 @@ class ImageProcessingWorker(BaseWorker):
             # Apply filters in order
             processed_image = self._apply_filters(image, task.filters)
             
-            # Save processed image
-            processed_image.save(task.output_path, quality=95, optimize=True)
+            # Save processed image via temp-and-rename so an output that is
+            # a hardlink to the input is replaced rather than written through
+            root, ext = os.path.splitext(task.output_path)
+            tmp_path = f"{root}.tmp{ext}"
+            processed_image.save(tmp_path, quality=95, optimize=True)
+            os.replace(tmp_path, task.output_path)
             
             # Calculate processing time
             processing_time = time.time() - start_time
@@ -101,15 +112,17 @@ class ImageProcessingWorker(BaseWorker):
     def _apply_filters(self, image: Image.Image, filters: Dict[FilterType, float]) -> Image.Image:
         """Apply multiple filters to an image"""
         result = image.copy()
+        tone_adjustments = []
         
         for filter_type, value in filters.items():
-            if filter_type == FilterType.BRIGHTNESS:
-                result = self._adjust_brightness(result, value)
-            elif filter_type == FilterType.CONTRAST:
-                result = self._adjust_contrast(result, value)
-            elif filter_type == FilterType.SATURATION:
-                result = self._adjust_saturation(result, value)
-            elif filter_type == FilterType.BLUR:
+            if filter_type in TONE_FILTERS:
+                tone_adjustments.append((filter_type, value))
+                continue
+            if tone_adjustments:
+                result = self._apply_tone_adjustments(result, tone_adjustments)
+                tone_adjustments = []
+                
+            if filter_type == FilterType.BLUR:
                 result = self._apply_blur(result, value)
             elif filter_type == FilterType.SHARPEN:
                 result = self._apply_sharpen(result, value)
@@ -122,22 +135,57 @@ class ImageProcessingWorker(BaseWorker):
             elif filter_type == FilterType.INVERT:
                 result = self._invert_colors(result)
                 
+        if tone_adjustments:
+            result = self._apply_tone_adjustments(result, tone_adjustments)
+                
         return result
         
-    def _adjust_brightness(self, image: Image.Image, factor: float) -> Image.Image:
-        """Adjust brightness: -100 to +100 mapped to 0.0 to 2.0"""
-        # Convert from -100 to +100 range to 0.0 to 2.0 range
-        brightness_factor = (factor + 100) / 100
-        enhancer = ImageEnhance.Brightness(image)
-        return enhancer.enhance(brightness_factor)
+    def _apply_tone_adjustments(self, image: Image.Image,
+                                adjustments) -> Image.Image:
+        """
+        Apply brightness/contrast/saturation with PIL's ImageEnhance semantics
+        (alpha is left untouched). Brightness (-100 to +100 mapped to 0.0 to
+        2.0) and contrast (0.5x to 2x around the mean luma) are per-channel
+        maps on 8-bit values, so runs of them fold into one 256-entry LUT.
+        """
+        lut = np.arange(256, dtype=np.float32)
         
-    def _adjust_contrast(self, image: Image.Image, factor: float) -> Image.Image:
-        """Adjust contrast: 0.5x to 2x"""
-        enhancer = ImageEnhance.Contrast(image)
-        return enhancer.enhance(factor)
+        for filter_type, value in adjustments:
+            if filter_type == FilterType.SATURATION:
+                image = self._apply_tone_lut(image, lut)
+                image = self._adjust_saturation(image, value)
+                lut = np.arange(256, dtype=np.float32)
+                continue
+                
+            if filter_type == FilterType.BRIGHTNESS:
+                lut *= (value + 100) / 100
+            elif filter_type == FilterType.CONTRAST:
+                mean = self._mean_luma(image, lut)
+                lut -= mean
+                lut *= value
+                lut += mean
+            np.clip(lut, 0, 255, out=lut)
+            
+        return self._apply_tone_lut(image, lut)
+        
+    def _mean_luma(self, image: Image.Image, lut: np.ndarray) -> int:
+        """Mean luma of image after lut, computed from its histogram"""
+        hist = np.asarray(image.histogram(), dtype=np.float64).reshape(-1, 256)[:3]
+        channel_means = hist @ lut / hist[0].sum()
+        return int(float(channel_means @ LUMA_WEIGHTS) + 0.5)
+        
+    def _apply_tone_lut(self, image: Image.Image, lut: np.ndarray) -> Image.Image:
+        """Map the RGB bands through lut in a single point() pass"""
+        table = np.rint(lut).astype(np.uint8)
+        if np.array_equal(table, np.arange(256)):
+            return image
+        table = table.tolist() * 3
+        if image.mode == 'RGBA':
+            table += list(range(256))
+        return image.point(table)
         
     def _adjust_saturation(self, image: Image.Image, factor: float) -> Image.Image:
-        """Adjust saturation: 0 to 2x"""
+        """Adjust saturation: 0 to 2x (luma-dependent, so not LUT-able)"""
         enhancer = ImageEnhance.Color(image)
         return enhancer.enhance(factor)
         